@@ -0,0 +1,208 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from main import encode_image, ENTROPY_WORKERS
+from PipelineConfig import PipelineConfig
+from Instrumentation import Instrumentation
+from DiscreteCosineTransformer import BACKENDS
+from HuffmanEncoder import EXECUTORS
+
+#
+# Benchmark suite for the encoder pipeline (main.encode_image, production profile)
+# --> synthetic images of fixed sizes and content types, every supported subsampling mode and
+#     a range of quality factors; per stage timings come from the Instrumentation records
+#
+# Usage:
+#   python Benchmark.py --save                 run + store the results as baseline
+#   python Benchmark.py --compare              run + flag slowdowns against the baseline
+#   python Benchmark.py --sizes 256 1MP 12MP --contents noise photo --qualities 50 --tolerance 0.2
+#   python Benchmark.py --sizes 12MP --entropy-workers 1 8 32   entropy coder scaling (1 vs N workers)
+#
+
+# Image sizes (width, height)
+SIZES = {
+    "256": (256, 256),
+    "1MP": (1024, 1024),
+    "12MP": (4000, 3000),
+    "48MP": (8000, 6000),
+}
+CONTENTS = ("flat", "noise", "gradient", "photo")
+# All modes ChromaSubsampler supports
+SUBSAMPLING_MODES = ((4, 4, 4), (4, 2, 2), (4, 2, 0))
+QUALITIES = (25, 50, 75, 95)
+# Pools for the restart segments (see HuffmanEncoder.EXECUTORS)
+ENTROPY_EXECUTORS = ("process", "thread")
+
+DEFAULT_SIZES = ("256", "1MP")
+DEFAULT_BASELINE = Path('./benchmark_baseline.json')
+# Stages faster than this (in the baseline) are too noisy to be compared
+MIN_COMPARE_SECONDS = 0.002
+
+# Synthetic RGB test image --> same seed, same image
+# - flat:     one color (best case for the entropy coder)
+# - noise:    uniform random pixels (worst case: almost no zero coefficients)
+# - gradient: smooth horizontal/vertical color ramps
+# - photo:    smooth blobs + fine texture + hard edges, roughly like a natural photo
+def synthetic_image(width, height, content, seed=0):
+    rng = np.random.default_rng(seed)
+    if content == "flat":
+        pixels = np.empty((height, width, 3), dtype=np.uint8)
+        pixels[:] = (90, 140, 200)
+    elif content == "noise":
+        pixels = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    elif content == "gradient":
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+        pixels = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1).astype(np.uint8)
+    elif content == "photo":
+        pixels = __photo_like(width, height, rng)
+    else:
+        raise ValueError(f"Unknown content type '{content}', expected one of {CONTENTS}")
+    image = Image.fromarray(pixels, "RGB")
+    # encode_image names the output after the source file
+    image.filename = f"bench_{width}x{height}_{content}.png"
+    return image
+
+def __photo_like(width, height, rng):
+    # Low-frequency color field: random coarse grid, upscaled bilinearly by PIL
+    coarse = rng.integers(0, 256, (max(height // 64, 2), max(width // 64, 2), 3), dtype=np.uint8)
+    smooth = np.asarray(Image.fromarray(coarse, "RGB").resize((width, height), Image.BILINEAR), dtype=np.float32)
+    # Fine texture (sensor noise, foliage, ...)
+    smooth += rng.normal(0, 6, (height, width, 1)).astype(np.float32)
+    # A few hard-edged rectangles (objects)
+    for _ in range(8):
+        top, left = rng.integers(0, height), rng.integers(0, width)
+        bottom, right = top + rng.integers(1, height // 3 + 2), left + rng.integers(1, width // 3 + 2)
+        smooth[top:bottom, left:right] = rng.integers(0, 256, 3)
+    return np.clip(smooth, 0, 255).astype(np.uint8)
+
+# Run all combinations --> {case key: {"total_s": ..., "stages": {stage: seconds}, ...}}
+# Every case runs <repeat> times, the fastest run counts (least disturbed by other processes)
+def run_benchmarks(sizes=DEFAULT_SIZES, contents=CONTENTS, modes=SUBSAMPLING_MODES, qualities=QUALITIES, repeat=3,
+                   dct_backend="matrix"):
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for size in sizes:
+            width, height = SIZES[size]
+            for content in contents:
+                image = synthetic_image(width, height, content)
+                for mode in modes:
+                    for q_factor in qualities:
+                        key = f"{size}/{content}/{mode[0]}:{mode[1]}:{mode[2]}/q{q_factor}"
+                        config = PipelineConfig.profile("production", q_factor=q_factor, subsampling=mode,
+                                                        dct_backend=dct_backend, instrument=True, trace_memory=False)
+                        results[key] = __run_case(image, config, repeat, out_dir)
+                        print(f"{key:<32} {results[key]['total_s']:8.4f} s  {results[key]['bytes']:>10} bytes")
+    return results
+
+# Scaling of the entropy coder: the same image with restart markers, encoded with 1 .. N workers
+# per executor --> {case key: ...} like run_benchmarks, the "HuffmanEncoder.encode" stage is the one to compare
+# (photo content, 4:2:0, q50; restart markers are forced on, whatever the image size)
+# Every worker count gets one long-lived pool --> pool start-up is not part of the timings
+def run_entropy_scaling(sizes=DEFAULT_SIZES, workers=(1, 2, 4, 8), executors=ENTROPY_EXECUTORS, repeat=3):
+    results = {}
+    with tempfile.TemporaryDirectory() as out_dir:
+        for size in sizes:
+            width, height = SIZES[size]
+            image = synthetic_image(width, height, "photo")
+            for executor in executors:
+                config = PipelineConfig.profile("production", restart_min_pixels=0, entropy_executor=executor,
+                                                instrument=True, trace_memory=False)
+                serial = None
+                for count in workers:
+                    key = f"{size}/photo/entropy/{executor}/w{count}"
+                    with EXECUTORS[executor](max_workers=count) as pool:
+                        results[key] = __run_case(image, config, repeat, out_dir, entropy_workers=count,
+                                                  entropy_pool=pool)
+                    seconds = results[key]["stages"]["HuffmanEncoder.encode"]
+                    serial = serial or seconds
+                    print(f"{key:<32} {seconds:8.4f} s  speedup {serial / seconds:5.2f}x")
+    return results
+
+def __run_case(image, config, repeat, out_dir, entropy_workers=ENTROPY_WORKERS, entropy_pool=None):
+    best = None
+    for _ in range(repeat):
+        with Instrumentation(trace_memory=False) as instruments, contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = encode_image(image, config, entropy_workers, instruments=instruments, out_dir=out_dir,
+                                  entropy_pool=entropy_pool)
+            total = time.perf_counter() - start
+        if best is None or total < best["total_s"]:
+            best = {
+                "total_s": total,
+                "stages": {record["stage"]: record["wall_s"] for record in instruments.records},
+                "bytes": result["bytes"],
+                "megapixels": image.size[0] * image.size[1] / 1e6,
+            }
+    return best
+
+def save_baseline(results, path):
+    data = {
+        "machine": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()},
+        "results": results,
+    }
+    Path(path).write_text(json.dumps(data, indent=2))
+    print(f"Saved baseline with {len(results)} cases to '{path}'")
+
+# Compare against the baseline --> list of (case, stage, baseline seconds, current seconds) that
+# got slower than baseline * (1 + tolerance); stage "total" = the whole encode
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, current in results.items():
+        if key not in baseline:
+            continue
+        previous = baseline[key]
+        timings = [("total", previous["total_s"], current["total_s"])]
+        timings += [(stage, seconds, current["stages"].get(stage)) for stage, seconds in previous["stages"].items()]
+        for stage, before, now in timings:
+            if now is None or before < MIN_COMPARE_SECONDS:
+                continue
+            if now > before * (1 + tolerance):
+                regressions.append((key, stage, before, now))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the JPEG encoder pipeline on synthetic images")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, choices=SIZES)
+    parser.add_argument("--contents", nargs="+", default=CONTENTS, choices=CONTENTS)
+    parser.add_argument("--qualities", nargs="+", type=int, default=QUALITIES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dct-backend", default="matrix", choices=BACKENDS)
+    parser.add_argument("--entropy-workers", nargs="+", type=int,
+                        help="measure the entropy coder with these worker counts instead of the regular cases")
+    parser.add_argument("--executors", nargs="+", default=ENTROPY_EXECUTORS, choices=ENTROPY_EXECUTORS)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="flag slowdowns against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown, e.g. 0.15 = 15%%")
+    args = parser.parse_args(argv)
+
+    if args.entropy_workers:
+        results = run_entropy_scaling(args.sizes, args.entropy_workers, args.executors, args.repeat)
+    else:
+        results = run_benchmarks(args.sizes, args.contents, SUBSAMPLING_MODES, args.qualities, args.repeat,
+                                 args.dct_backend)
+    if args.save:
+        save_baseline(results, args.baseline)
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for key, stage, before, now in regressions:
+            print(f"SLOWER: {key} {stage}: {before:.4f} s --> {now:.4f} s ({now / before - 1:+.0%})")
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%} "
+              f"({len(set(results) & set(baseline))} cases compared)")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import numpy as np
+
+# Use this class to pack Huffman codes and amplitude bits into real bytes
+# --> (value, length) integers go in, entropy-coded bytes come out
+# JPEG specifics:
+# - byte stuffing: every 0xFF byte in the entropy-coded data is followed by 0x00
+#   (otherwise a decoder would mistake it for a marker)
+# - padding: the last byte is filled up with 1-bits
+class BitWriter:
+    # Number of (value, length) pairs packed per numpy chunk in write_arrays
+    # --> bounds the temporary memory
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self):
+        self.__buffer = bytearray()
+        # Bits that do not fill a whole byte yet (at most 64 bits are kept)
+        self.__accumulator = 0
+        self.__bit_count = 0
+        # Total number of bits written (without stuffing and padding)
+        self.total_bits = 0
+
+    # Append the lowest <length> bits of value (most significant bit first)
+    def write(self, value, length):
+        if length == 0:
+            return
+        self.__accumulator = (self.__accumulator << length) | (value & ((1 << length) - 1))
+        self.__bit_count += length
+        self.total_bits += length
+        # Emit whole bytes once half of the 64-bit accumulator is filled
+        if self.__bit_count >= 32:
+            self.__emit_bytes()
+
+    # Vectorized write: append many (value, length) pairs at once
+    # --> values/lengths are equally long integer arrays, entries with length 0 are skipped
+    def write_arrays(self, values, lengths):
+        values = np.asarray(values, dtype=np.uint32)
+        lengths = np.asarray(lengths, dtype=np.uint8)
+        for start in range(0, len(values), self.CHUNK_SIZE):
+            self.__write_chunk(values[start:start + self.CHUNK_SIZE], lengths[start:start + self.CHUNK_SIZE])
+
+    # Return all completed bytes written so far (and remove them from the internal buffer)
+    # --> allows streaming the output while encoding
+    def take(self):
+        self.__emit_bytes()
+        data = bytes(self.__buffer)
+        self.__buffer.clear()
+        return data
+
+    # Pad the last byte with 1-bits and return all remaining bytes
+    def flush(self):
+        padding = (8 - self.__bit_count % 8) % 8
+        self.__accumulator = (self.__accumulator << padding) | ((1 << padding) - 1)
+        self.__bit_count += padding
+        return self.take()
+
+    # Pack a chunk into 64-bit words: every value lands in the word containing its first bit,
+    # values crossing a word boundary spill their lowest bits into the next word
+    def __write_chunk(self, values, lengths):
+        keep = lengths > 0
+        # Bits still waiting in the accumulator go first
+        values = np.concatenate(([self.__accumulator], values[keep])).astype(np.uint64)
+        lengths = np.concatenate(([self.__bit_count], lengths[keep])).astype(np.uint64)
+        self.total_bits += int(lengths.sum()) - self.__bit_count
+
+        ends = np.cumsum(lengths)
+        starts = ends - lengths
+        if lengths[0] == 0:
+            # Nothing pending --> drop the empty first entry
+            values, lengths, starts, ends = values[1:], lengths[1:], starts[1:], ends[1:]
+        if len(values) == 0:
+            return
+        total_bits = int(ends[-1])
+
+        word = starts >> np.uint64(6)
+        # End position of each value relative to the start of its word (1 .. 64 + 31)
+        end_in_word = ends - (word << np.uint64(6))
+        crossing = end_in_word > 64
+        parts = np.where(crossing,
+                         values >> np.where(crossing, end_in_word - np.uint64(64), 0).astype(np.uint64),
+                         values << np.where(crossing, 0, np.uint64(64) - end_in_word).astype(np.uint64))
+
+        words = np.zeros((total_bits + 63) // 64, dtype=np.uint64)
+        # Values are sorted by position --> OR together all parts of the same word
+        first_of_word = np.flatnonzero(np.concatenate(([True], word[1:] != word[:-1])))
+        words[word[first_of_word]] = np.bitwise_or.reduceat(parts, first_of_word)
+        # At most one value crosses each word boundary --> its spill goes to the next word
+        spill_shift = (np.uint64(128) - end_in_word[crossing]).astype(np.uint64)
+        words[word[crossing] + np.uint64(1)] |= values[crossing] << spill_shift
+
+        # Emit all whole bytes, keep the remaining bits in the accumulator
+        data = words.astype('>u8').tobytes()
+        whole = total_bits // 8
+        self.__bit_count = total_bits % 8
+        self.__accumulator = data[whole] >> (8 - self.__bit_count) if self.__bit_count else 0
+        self.__append(data[:whole])
+
+    # Move all whole bytes from the accumulator to the buffer
+    def __emit_bytes(self):
+        num_bytes = self.__bit_count // 8
+        if num_bytes == 0:
+            return
+        self.__bit_count -= num_bytes * 8
+        chunk = (self.__accumulator >> self.__bit_count).to_bytes(num_bytes, 'big')
+        self.__accumulator &= (1 << self.__bit_count) - 1
+        self.__append(chunk)
+
+    def __append(self, chunk):
+        # JPEG byte stuffing: 0xFF --> 0xFF 0x00
+        self.__buffer += chunk.replace(b'\xff', b'\xff\x00')
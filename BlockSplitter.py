@@ -41,3 +41,15 @@ class BlockSplitter:
         Cb_blocks = self.__split_channel(Cb)
         Cr_blocks = self.__split_channel(Cr)
         return Y_blocks, Cb_blocks, Cr_blocks
+
+    # Use this 'public' method to get the coding order of a blocked channel in an interleaved scan:
+    # an MCU holds h_factor x v_factor blocks of this channel (e.g. 2 x 2 luma blocks for 4:2:0),
+    # MCUs are visited in raster order and so are the blocks inside each MCU
+    # --> returns the raster (row-major) block indices in MCU order
+    def mcu_order(self, num_vertical, num_horizontal, h_factor, v_factor):
+        if num_vertical % v_factor or num_horizontal % h_factor:
+            raise ValueError(f"Block grid {(num_vertical, num_horizontal)} is not a multiple "
+                             f"of the MCU size {(v_factor, h_factor)}")
+        indices = np.arange(num_vertical * num_horizontal).reshape(num_vertical // v_factor, v_factor,
+                                                                   num_horizontal // h_factor, h_factor)
+        return indices.transpose(0, 2, 1, 3).ravel()
@@ -3,31 +3,55 @@ from PIL import Image
 
 # Use this class for chroma subsampling
 class ChromaSubsampler:
-    # Expects an YCbCr image
+    # Expects an YCbCr image (or None if only arrays are processed, e.g. subsample_channels, upsample,
+    # luma_sampling_factors)
     # L: Luma subsampling factor
     # Ch: Horizontal chroma sampling factor
     # Cv: Vertical chroma sampling factor
+    # upsampling: filter of upsample, see UPSAMPLING_FILTERS
+    # verbose: print the resulting channel shapes
+    UPSAMPLING_FILTERS = ("nearest", "fancy")
 
-    def __init__(self, image: Image.Image, L: int, Ch: int, Cv: int):
+    def __init__(self, image: Image.Image, L: int, Ch: int, Cv: int, upsampling="nearest", verbose=False):
         # Check for color space
-        if(image.mode != "YCbCr"):
+        if(image is not None and image.mode != "YCbCr"):
             raise ValueError(f"Expected image in YCbCr mode, got {image.mode}")
 
         # Check for valid subsampling values
         if ((L, Ch, Cv) not in [(4, 4, 4), (4, 2, 2), (4, 2, 0)]):
             raise ValueError(f"Chroma subsampling can be 4:4:4, 4:2:2, or 4:2:0 for YCbCr")
+        if upsampling not in self.UPSAMPLING_FILTERS:
+            raise ValueError(f"Unknown upsampling filter '{upsampling}', expected one of {self.UPSAMPLING_FILTERS}")
 
         # If no errors occurred, initialize
         self.image = image
         self.L, self.Ch, self.Cv = L, Ch, Cv
+        self.upsampling = upsampling
+        self.verbose = verbose
+        # uint16 scratch buffers of the averaging sums, by shape
+        self.__scratch = {}
 
 
     def subsample(self):
         Y, Cb, Cr = self.__convert_channels_to_arrays()
+        Y, Cb, Cr = self.subsample_channels(Y, Cb, Cr)
+        if self.verbose:
+            print(f"Y: {Y.shape}, Cb: {Cb.shape}, Cr: {Cr.shape}")
+        return Y, Cb, Cr
 
+    # Subsample channel arrays directly (e.g. one strip of a large image)
+    # --> same as subsample, but without converting the image first
+    # Integer averaging with rounding; odd edges are replicated --> Cb/Cr have ceil(w / 2) columns
+    # (and ceil(h / 2) rows for 4:2:0)
+    # out: optional preallocated (Cb, Cr) uint8 buffers of exactly these shapes (4:4:4 --> Cb/Cr are copied)
+    def subsample_channels(self, Y, Cb, Cr, out=None):
+        Cb_out, Cr_out = self.__check_buffers(Cb, Cr, out) if out is not None else (None, None)
         # 4:4:4 → no chroma subsampling at all
         if (self.L, self.Ch, self.Cv) == (4, 4, 4):
-            print(f"Y: {Y.shape}, Cb: {Cb.shape}, Cr: {Cr.shape}")
+            if out is not None:
+                np.copyto(Cb_out, Cb)
+                np.copyto(Cr_out, Cr)
+                return Y, Cb_out, Cr_out
             return Y, Cb, Cr
 
         # 4:2:2 → reduce columns by half
@@ -36,8 +60,8 @@ class ChromaSubsampler:
             #Cb = Cb[:, ::2]
             #Cr = Cr[:, ::2]
             # average pixel pairs across columns
-            Cb = self.__subsample_422(Cb)
-            Cr = self.__subsample_422(Cr)
+            Cb = self.__subsample_422(Cb, Cb_out)
+            Cr = self.__subsample_422(Cr, Cr_out)
 
         # 4:2:0 → reduce columns AND rows by half
         if(self.L, self.Ch, self.Cv) == (4, 2, 0):
@@ -45,33 +69,57 @@ class ChromaSubsampler:
             #Cb = Cb[::2, ::2]
             #Cr = Cr[::2, ::2]
             # average pixel blocks across columns AND rows (2x2 blocks)
-            Cb = self.__subsample_420(Cb)
-            Cr = self.__subsample_420(Cr)
+            Cb = self.__subsample_420(Cb, Cb_out)
+            Cr = self.__subsample_420(Cr, Cr_out)
 
-        print(f"Y: {Y.shape}, Cb: {Cb.shape}, Cr: {Cr.shape}")
         return Y, Cb, Cr
 
+    # Upsample Cb/Cr back to the size of Y (verification/decoding path) with the upsampling filter
     def upsample(self, Y, Cb, Cr):
         # 4:4:4 → no chroma subsampling at all
         if (self.L, self.Ch, self.Cv) == (4, 4, 4):
-            print(f"Y: {Y.shape}, Cb: {Cb.shape}, Cr: {Cr.shape}")
+            if self.verbose:
+                print(f"Y: {Y.shape}, Cb: {Cb.shape}, Cr: {Cr.shape}")
             return Y, Cb, Cr
-        if (self.L, self.Ch, self.Cv) == (4, 2, 2):
-            Cb = self.__upsample_422(Cb, Y.shape)
-            Cr = self.__upsample_422(Cr, Y.shape)
 
-        if (self.L, self.Ch, self.Cv) == (4, 2, 0):
-            Cb = self.__upsample_420(Cb, Y.shape)
-            Cr = self.__upsample_420(Cr, Y.shape)
+        # 4:2:2 → double the columns, 4:2:0 → double columns AND rows
+        h_factor, v_factor = self.luma_sampling_factors()
+        if self.upsampling == "fancy":
+            Cb = self.__upsample_fancy(Cb, h_factor, v_factor, Y.shape)
+            Cr = self.__upsample_fancy(Cr, h_factor, v_factor, Y.shape)
+        else:
+            Cb = self.__upsample_nearest(Cb, h_factor, v_factor, Y.shape)
+            Cr = self.__upsample_nearest(Cr, h_factor, v_factor, Y.shape)
 
         return Y, Cb, Cr
 
+    # Sampling factors (horizontal, vertical) of the luma channel relative to chroma
+    # --> how many luma blocks share one chroma block (needed for the JPEG frame header)
+    def luma_sampling_factors(self):
+        if (self.L, self.Ch, self.Cv) == (4, 2, 2):
+            return 2, 1
+        if (self.L, self.Ch, self.Cv) == (4, 2, 0):
+            return 2, 2
+        return 1, 1
+
     # Use this 'private' method for converting color channels to arrays
     # --> easier to use/manipulate further
     def __convert_channels_to_arrays(self):
         Y, Cb, Cr = self.image.split()
         return np.array(Y), np.array(Cb), np.array(Cr)
 
+    # Use this 'private' method to check the out buffers of subsample_channels
+    # --> uint8 + the subsampled shape, otherwise values would wrap or be left unwritten
+    def __check_buffers(self, Cb, Cr, out):
+        h_factor, v_factor = self.luma_sampling_factors()
+        Cb_out, Cr_out = out
+        for channel, buffer in ((Cb, Cb_out), (Cr, Cr_out)):
+            height, width = channel.shape
+            shape = (-(-height // v_factor), -(-width // h_factor))
+            if buffer.dtype != np.uint8 or buffer.shape != shape:
+                raise ValueError(f"Expected uint8 buffer of shape {shape}, got {buffer.dtype} buffer of shape {buffer.shape}")
+        return Cb_out, Cr_out
+
     # Use this 'private' method for 4:2:2 subsampling using averaging
     # --> build average of pixel pairs across columns, ex:
     # from:
@@ -81,14 +129,8 @@ class ChromaSubsampler:
     # to:
     # [(a+b)/2, (c+d)/2,
     #  (e+f)/2, (g+h)/2] --> 2 x 2 shape
-    def __subsample_422(self, channel: np.ndarray):
-        height, width = channel.shape
-        # ensure even number of columns
-        channel = channel[:, :width - (width % 2)]
-        # reshape, so that 2 columns are grouped together for averaging their pixel pairs
-        channel = channel.reshape(height, width // 2, 2)
-        # average along axis=2 --> refers to the chroma pixel pairs
-        return channel.mean(axis=2).astype(np.uint8)
+    def __subsample_422(self, channel: np.ndarray, out=None):
+        return self.__average(channel, 2, 1, out)
 
     # Use this 'private' method for 4:2:0 subsampling using averaging
     # --> build average of 2 x 2 pixel blocks across columns AND rows, ex:
@@ -98,41 +140,91 @@ class ChromaSubsampler:
     #
     # to:
     # [(a+b+e+f)/4, (c+d+g+h)/4] --> 1x2 shape
-    def __subsample_420(self, channel: np.ndarray):
+    def __subsample_420(self, channel: np.ndarray, out=None):
+        return self.__average(channel, 2, 2, out)
+
+    # Use this 'private' method for averaging h_step x v_step pixel blocks with integers only
+    # --> sum the block's pixels (uint16 scratch buffer), add half the divisor and shift, ex. for 2 x 2:
+    #     (a + b + e + f + 2) >> 2 --> rounded average
+    # Odd edges: the last column/row is replicated, i.e. the edge blocks average the pixels they have
+    # --> output shape: ceil(height / v_step) x ceil(width / h_step)
+    def __average(self, channel, h_step, v_step, out=None):
         height, width = channel.shape
-        # ensure even number of rows and columns
-        channel = channel[:height - (height % 2), :width - (width % 2)]
-        # reshape, so that pixel values are grouped together in a 2 x 2 block
-        channel = channel.reshape(height // 2, 2, width // 2, 2)
-        # average along axis 1 (horizontal grouping) and 3 (vertical grouping) --> in total
-        # average across 2 x 2 block
-        return channel.mean(axis=(1, 3)).astype(np.uint8)
-
+        if out is None:
+            out = np.empty((-(-height // v_step), -(-width // h_step)), dtype=np.uint8)
+        even_height, even_width = height - height % v_step, width - width % h_step
+        rows, columns = even_height // v_step, even_width // h_step
+
+        if rows and columns:
+            total = self.__scratch_buffer((rows, columns))
+            np.copyto(total, channel[0:even_height:v_step, 0:even_width:h_step])
+            for dy in range(v_step):
+                for dx in range(h_step):
+                    if dy or dx:
+                        np.add(total, channel[dy:even_height:v_step, dx:even_width:h_step], out=total)
+            shift = (h_step * v_step).bit_length() - 1
+            total += (1 << shift) >> 1
+            total >>= shift
+            out[:rows, :columns] = total
+
+        # Odd edges --> average without the missing neighbors
+        if width != even_width:
+            self.__average(channel[:even_height, -1:], 1, v_step, out[:rows, -1:])
+        if height != even_height:
+            self.__average(channel[-1:], h_step, 1, out[-1:])
+        return out
 
-    def __upsample_422(self, channel, target_shape):
-        h, w = target_shape
-        return channel.repeat(2, axis=0)[:h, :w]
+    # Use this 'private' method to reuse the uint16 sums between calls (Cb and Cr, strips of the same size)
+    def __scratch_buffer(self, shape):
+        if shape not in self.__scratch:
+            self.__scratch[shape] = np.empty(shape, dtype=np.uint16)
+        return self.__scratch[shape]
+
+    # Use this 'private' method for nearest neighbor upsampling
+    # --> every chroma pixel is copied into its h_factor x v_factor block (strided writes, no repeat copies)
+    def __upsample_nearest(self, channel, h_factor, v_factor, target_shape):
+        out = np.empty(target_shape, dtype=np.uint8)
+        for dy in range(v_factor):
+            for dx in range(h_factor):
+                target = out[dy::v_factor, dx::h_factor]
+                target[:] = self.__pad(channel, target.shape)
+        return out
 
-    def __upsample_420(self, channel, target_shape):
+    # Use this 'private' method for bilinear ("fancy") upsampling, as in libjpeg's jdsample.c
+    # --> every output pixel is 3/4 its own chroma pixel + 1/4 the nearest neighbor (per doubled axis), ex.
+    #     one row [a, b] --> [a, (3a+b)/4, (a+3b)/4, b]
+    #     4:2:0: both axes, weights 9/16, 3/16, 3/16, 1/16; rounded once at the end
+    def __upsample_fancy(self, channel, h_factor, v_factor, target_shape):
         h, w = target_shape
-        upsampled = channel.repeat(2, axis=0).repeat(2, axis=1)[:h, :w]
-        if(target_shape == upsampled.shape):
-            return upsampled
-        return self.__pad(upsampled, target_shape)
-
+        # max. 255 * 16 --> fits into uint16
+        values = channel.astype(np.uint16)
+        scale = 1
+        for axis, factor in ((0, v_factor), (1, h_factor)):
+            if factor == 2:
+                values = self.__triangle_filter(values, axis)
+                scale *= 4
+        shift = scale.bit_length() - 1
+        values += scale >> 1
+        values >>= shift
+        return self.__pad(values[:h, :w].astype(np.uint8), target_shape)
+
+    # Use this 'private' method to double one axis with weights 3:1 (scaled by 4, edges replicated)
+    def __triangle_filter(self, values, axis):
+        length = values.shape[axis]
+        indices = np.arange(length)
+        previous = np.take(values, np.maximum(indices - 1, 0), axis=axis)
+        following = np.take(values, np.minimum(indices + 1, length - 1), axis=axis)
+        center = values * 3
+        # Interleave --> even outputs lean towards the previous, odd outputs towards the following pixel
+        doubled = np.stack((center + previous, center + following), axis=axis + 1)
+        shape = list(values.shape)
+        shape[axis] *= 2
+        return doubled.reshape(shape)
+
+    # Use this 'private' method to bring a channel to target_shape (crop, or replicate the last row/column)
     def __pad(self, channel, target_shape):
         h, w = target_shape
-        out = np.zeros(target_shape, dtype=channel.dtype)
-        out[:channel.shape[0], :channel.shape[1]] = channel
-
-        # Repeat last row if needed
-        if channel.shape[0] < h:
-            print("OUT: ", out.shape)
-            print("CHANNEL: ", channel.shape)
-            out[channel.shape[0]:, :channel.shape[1]] = channel[-1:, :]
-
-        # Repeat last column if needed
-        if channel.shape[1] < w:
-            out[:, channel.shape[1]:] = out[:, channel.shape[1] - 1:channel.shape[1]]
-
-        return out
+        channel = channel[:h, :w]
+        if channel.shape == target_shape:
+            return channel
+        return np.pad(channel, ((0, h - channel.shape[0]), (0, w - channel.shape[1])), mode="edge")
@@ -1,5 +1,24 @@
+import numpy as np
 from PIL import Image
 
+# Fixed-point BT.601 (JFIF, full range) RGB --> YCbCr coefficients, scaled by 2^SCALE_BITS
+# Source: libjpeg's jccolor.c
+#   Y  =  0.29900 R + 0.58700 G + 0.11400 B
+#   Cb = -0.16874 R - 0.33126 G + 0.50000 B + 128
+#   Cr =  0.50000 R - 0.41869 G - 0.08131 B + 128
+SCALE_BITS = 16
+YCBCR_MATRIX = np.round(np.array([
+    [0.29900, 0.58700, 0.11400],
+    [-0.16874, -0.33126, 0.50000],
+    [0.50000, -0.41869, -0.08131],
+]) * (1 << SCALE_BITS)).astype(np.int32)
+YCBCR_OFFSETS = (0, 128 << SCALE_BITS, 128 << SCALE_BITS)
+# Added before shifting down --> rounding instead of truncation
+ROUNDING = 1 << (SCALE_BITS - 1)
+# Rows converted per pass in convert_arrays (even --> 2 x 2 chroma blocks never span two passes)
+# --> bounds the int32 temporaries to a few rows of the image
+CHUNK_ROWS = 64
+
 # Use this class to mainly convert from RGB --> YCbCr
 class ColorSpaceConverter:
     # Expects an input and output color space
@@ -12,3 +31,67 @@ class ColorSpaceConverter:
         image = image.convert(self.color_from)
         return image.convert(self.color_to)
 
+    # NumPy path (RGB --> YCbCr only): RGB image/uint8 array (h, w, 3) --> planar uint8 Y, Cb, Cr arrays
+    # - integer math only (see YCBCR_MATRIX), the image is converted in strips of CHUNK_ROWS rows
+    # - subsampling (L, Ch, Cv): 4:2:2/4:2:0 chroma averaging happens in the same pass
+    #   --> full-resolution chroma planes are never written; odd edges are replicated,
+    #       so Cb/Cr have ceil(w / 2) columns (and ceil(h / 2) rows for 4:2:0)
+    # - out: optional preallocated (Y, Cb, Cr) uint8 buffers of the right shapes (see plane_shapes)
+    # Same result as convert + ChromaSubsampler (up to +-1 from rounding)
+    def convert_arrays(self, image, subsampling=(4, 4, 4), out=None):
+        if (self.color_from, self.color_to) != ("RGB", "YCbCr"):
+            raise ValueError(f"Array conversion only supports RGB --> YCbCr, not {self.color_from} --> {self.color_to}")
+        if isinstance(image, Image.Image):
+            rgb = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+        else:
+            rgb = np.asarray(image)
+        if rgb.dtype != np.uint8 or rgb.ndim != 3 or rgb.shape[2] != 3:
+            raise ValueError(f"Expected an RGB uint8 array of shape (h, w, 3), got {rgb.dtype} array of shape {rgb.shape}")
+
+        height, width = rgb.shape[:2]
+        shapes = self.plane_shapes(width, height, subsampling)
+        if out is None:
+            out = tuple(np.empty(shape, dtype=np.uint8) for shape in shapes)
+        elif any(plane.dtype != np.uint8 or plane.shape != shape for plane, shape in zip(out, shapes)):
+            raise ValueError(f"Expected uint8 buffers of shapes {shapes}, got "
+                             f"{[(plane.dtype, plane.shape) for plane in out]}")
+        Y, Cb, Cr = out
+        h_step = 2 if subsampling in ((4, 2, 2), (4, 2, 0)) else 1
+        v_step = 2 if subsampling == (4, 2, 0) else 1
+
+        for top in range(0, height, CHUNK_ROWS):
+            chunk = rgb[top:top + CHUNK_ROWS].astype(np.int32)
+            R, G, B = chunk[..., 0], chunk[..., 1], chunk[..., 2]
+            Y[top:top + CHUNK_ROWS] = self.__fixed_point(R, G, B, 0) >> SCALE_BITS
+            # Chroma: sum the fixed-point values of each h_step x v_step block, round once
+            chroma_rows = slice(top // v_step, (top + len(chunk) + v_step - 1) // v_step)
+            for channel, plane in ((1, Cb), (2, Cr)):
+                summed = self.__block_sums(self.__fixed_point(R, G, B, channel), h_step, v_step)
+                shift = SCALE_BITS + (h_step * v_step).bit_length() - 1
+                plane[chroma_rows] = np.minimum(summed >> shift, 255)
+        return Y, Cb, Cr
+
+    # Shapes of the Y, Cb, Cr planes of convert_arrays
+    def plane_shapes(self, width, height, subsampling=(4, 4, 4)):
+        if subsampling not in ((4, 4, 4), (4, 2, 2), (4, 2, 0)):
+            raise ValueError(f"Chroma subsampling can be 4:4:4, 4:2:2, or 4:2:0 for YCbCr, got {subsampling}")
+        chroma_width = (width + 1) // 2 if subsampling != (4, 4, 4) else width
+        chroma_height = (height + 1) // 2 if subsampling == (4, 2, 0) else height
+        return (height, width), (chroma_height, chroma_width), (chroma_height, chroma_width)
+
+    # Fixed-point value (incl. offset and rounding term) of one output channel
+    def __fixed_point(self, R, G, B, channel):
+        r, g, b = YCBCR_MATRIX[channel]
+        return r * R + g * G + b * B + (YCBCR_OFFSETS[channel] + ROUNDING)
+
+    # Sum of each h_step x v_step block (odd edges: the last row/column counts twice)
+    def __block_sums(self, values, h_step, v_step):
+        if h_step == 2:
+            if values.shape[1] % 2:
+                values = np.concatenate((values, values[:, -1:]), axis=1)
+            values = values[:, 0::2] + values[:, 1::2]
+        if v_step == 2:
+            if values.shape[0] % 2:
+                values = np.concatenate((values, values[-1:]), axis=0)
+            values = values[0::2] + values[1::2]
+        return values
@@ -0,0 +1,94 @@
+import multiprocessing
+import queue
+import threading
+
+# Use this class to render/save the diagnostic previews (see Helper.show_blocks, save_subsample_plot)
+# in the background --> the encoder only hands over the (small) data and goes on encoding
+# - worker:  "thread" (same process) or "process" (separate process --> rendering does not compete
+#            with the encoder for the GIL; tasks and arguments must be picklable then)
+# - num_workers: number of processes rendering from the same queue
+#            (always one thread --> pyplot is not thread-safe)
+# - max_pending: size of the bounded queue between encoder and workers
+# - policy:  what submit does when the queue is full:
+#            "block": wait until there is room again (every preview gets saved)
+#            "drop":  skip the preview (encoding never waits, see dropped)
+# Call flush to wait for all pending previews, close (or the with statement) at shutdown
+class DiagnosticsSink:
+    WORKERS = ("thread", "process")
+    POLICIES = ("block", "drop")
+
+    def __init__(self, worker="thread", max_pending=32, policy="block", num_workers=1):
+        if worker not in self.WORKERS:
+            raise ValueError(f"Unknown diagnostics worker '{worker}', expected one of {self.WORKERS}")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}', expected one of {self.POLICIES}")
+        self.policy = policy
+        # Number of previews skipped because of the "drop" policy
+        self.dropped = 0
+
+        if worker == "thread":
+            self.__queue = queue.Queue(maxsize=max_pending)
+            self.__workers = [threading.Thread(target=_run_tasks, args=(self.__queue,), daemon=True)]
+        else:
+            self.__queue = multiprocessing.JoinableQueue(maxsize=max_pending)
+            self.__workers = [multiprocessing.Process(target=_run_tasks, args=(self.__queue,), daemon=True)
+                              for _ in range(num_workers)]
+        for thread_or_process in self.__workers:
+            thread_or_process.start()
+        self.__closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Queue function(*args) for the worker --> returns False if it was dropped
+    def submit(self, function, *args):
+        if self.__closed:
+            raise RuntimeError("Diagnostics sink is already closed")
+        if self.policy == "block":
+            self.__queue.put((function, args))
+            return True
+        try:
+            self.__queue.put_nowait((function, args))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    # Wait until all queued previews are saved
+    def flush(self):
+        self.__queue.join()
+
+    # Save all pending previews and stop the workers
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        # None --> tells one worker to stop (after everything queued before it)
+        for _ in self.__workers:
+            self.__queue.put(None)
+        self.__queue.join()
+        for thread_or_process in self.__workers:
+            thread_or_process.join()
+        if self.dropped:
+            print(f"Diagnostics: dropped {self.dropped} previews (queue full)")
+
+# Worker loop (module level --> can be the target of a process)
+def _run_tasks(tasks):
+    # Previews are only written to files --> non-interactive backend (pyplot is used outside the main thread)
+    import matplotlib
+    matplotlib.use("Agg")
+    while True:
+        task = tasks.get()
+        try:
+            if task is None:
+                return
+            function, args = task
+            function(*args)
+        except Exception as e:
+            # A broken preview must not stop the remaining ones
+            print(f"Diagnostics: preview failed: {type(e).__name__}: {e}")
+        finally:
+            tasks.task_done()
@@ -1,27 +1,45 @@
+import numpy as np
+
 class DifferentialEncoder:
+    # verbose: print every block's DC difference (slow for large images --> opt-in only!)
+    def __init__(self, verbose=False):
+        self.verbose = verbose
 
     # Perform differential coding on DC coefficients of zigzag scanned blocks.
     # Each block’s DC coefficient is replaced by the difference from the previous block.
-    def differential_encode(self, Y_scan, Cb_scan, Cr_scan):
-        Y_diff = self.__diff_channel(Y_scan)
-        Cb_diff = self.__diff_channel(Cb_scan)
-        Cr_diff = self.__diff_channel(Cr_scan)
+    # Y_order: optional coding order of the luma blocks (see BlockSplitter.mcu_order) -->
+    # for interleaved scans, several luma blocks belong to one MCU, so the predecessor of a
+    # block is the previous block in MCU order, NOT in raster order. Chroma has exactly one
+    # block per MCU --> raster order already is the coding order.
+    # restart_interval: number of MCUs per restart segment (0 = no restart markers) -->
+    # every segment starts with a predictor of 0 again. Without Y_order (non-interleaved scans)
+    # every block is an MCU of its own.
+    def differential_encode(self, Y_scan, Cb_scan, Cr_scan, Y_order=None, restart_interval=0):
+        luma_per_mcu = len(Y_order) // max(len(Cb_scan), 1) if Y_order is not None else 1
+        Y_diff = self.diff_channel(Y_scan, Y_order, restart_interval * luma_per_mcu)
+        Cb_diff = self.diff_channel(Cb_scan, restart_blocks=restart_interval)
+        Cr_diff = self.diff_channel(Cr_scan, restart_blocks=restart_interval)
         return Y_diff, Cb_diff, Cr_diff
 
-    def __diff_channel(self, channel_scan):
-        # Perform differential coding for a single channel first
-        diff_scans = []
-        prev_dc = 0  # assume 0 for the first block
-        for i, block_scan in enumerate(channel_scan):
-            original_dc = block_scan[0]
-            # first block keeps its initial value --> others will be
-            # differential coded!
-            diff_dc = original_dc - prev_dc
-            # set original dc value to differential coded dc value
-            block_scan[0] = diff_dc
-            # add modified block
-            diff_scans.append(block_scan)
-            # swap dc for next run
-            prev_dc = original_dc
-            print(f"Block {i}: DC={original_dc} -> diff={diff_dc}")
+    # Perform differential coding for a single (num_blocks, 64) channel:
+    # one vectorized diff over the DC column (first block keeps its initial value)
+    # --> returns a new array, the blocks stay in their input order
+    # restart_blocks: reset the predictor every <restart_blocks> blocks (in coding order)
+    def diff_channel(self, channel_scan, order=None, restart_blocks=0):
+        diff_scans = np.array(channel_scan, copy=True)
+        if len(diff_scans) == 0:
+            return diff_scans
+        if order is None:
+            order = slice(None)
+        original_dc = diff_scans[order, 0].copy()
+        # prepend=0 --> assume 0 for the first block
+        diff_dc = np.diff(original_dc, prepend=0)
+        if restart_blocks:
+            # First block of each restart segment is predicted from 0 again
+            diff_dc[::restart_blocks] = original_dc[::restart_blocks]
+        diff_scans[order, 0] = diff_dc
+
+        if self.verbose:
+            for i, (dc, diff) in enumerate(zip(original_dc, diff_dc)):
+                print(f"Block {i}: DC={dc} -> diff={diff}")
         return diff_scans
@@ -1,37 +1,223 @@
+from functools import lru_cache
+
 from scipy.fftpack import dct, idct
+from scipy.fft import dctn, idctn
 import numpy as np
 
 # Source: https://stackoverflow.com/questions/7110899/how-do-i-apply-a-dct-to-an-image-in-python
 
-def DCT_2D(Y_blocks, Cb_blocks, Cr_blocks):
-    Y_blocks = Y_blocks.astype(np.float32)
-    Cb_blocks = Cb_blocks.astype(np.float32)
-    Cr_blocks = Cr_blocks.astype(np.float32)
+# Available DCT engines:
+# - "matrix":    all blocks of a channel at once via a precomputed DCT basis matrix (D @ B @ D.T)
+# - "scipy":     all blocks of a channel at once via scipy's dctn along the block axes (2, 3)
+# - "reference": the original per-block loop --> slow, but useful for checking the other backends
+# - "aan":       fixed-point integer AAN butterflies (see aan_channel) --> returns SCALED int32 coefficients,
+#                which must be quantized with the AAN tables: Quantizer.quantize_blocks(..., backend="aan")
+BACKENDS = ("matrix", "scipy", "reference", "aan")
+
+def DCT_2D(Y_blocks, Cb_blocks, Cr_blocks, backend="matrix", dtype=np.float32):
+    return (dct_channel(Y_blocks, backend, dtype),
+            dct_channel(Cb_blocks, backend, dtype),
+            dct_channel(Cr_blocks, backend, dtype))
 
-    for channel_blocks in (Y_blocks, Cb_blocks, Cr_blocks):
+# Transform all (nv, nh, N, N) blocks of a single channel
+# dtype: float32 (faster, less memory) or float64 (more accurate), ignored by "aan"
+def dct_channel(channel_blocks, backend="matrix", dtype=np.float32):
+    if backend == "aan":
+        return aan_channel(channel_blocks)
+    channel_blocks = channel_blocks.astype(dtype)
+    if backend == "matrix":
+        basis = __dct_basis(channel_blocks.shape[-1], np.dtype(dtype))
+        # matmul broadcasts over the leading (nv, nh) axes --> one call per channel
+        return basis @ channel_blocks @ basis.T
+    if backend == "scipy":
+        return dctn(channel_blocks, axes=(2, 3), norm='ortho').astype(dtype, copy=False)
+    if backend == "reference":
         num_vertical, num_horizontal, block_height, block_width = channel_blocks.shape
         for i in range(num_vertical):
             for j in range(num_horizontal):
                 channel_blocks[i, j] = __DCT_2D_per_block(channel_blocks[i, j])
-    return Y_blocks, Cb_blocks, Cr_blocks
+        return channel_blocks
+    raise ValueError(f"Unknown DCT backend '{backend}', expected one of {BACKENDS}")
 
 def __DCT_2D_per_block(block):
     return dct(dct(block.T, norm='ortho').T, norm='ortho')
 
+# Orthonormal DCT-II basis: row k holds c(k) * cos((2n + 1) * k * pi / 2N)
+# --> computed once per block size and dtype
+@lru_cache(maxsize=None)
+def __dct_basis(size, dtype):
+    k = np.arange(size).reshape(-1, 1)
+    n = np.arange(size).reshape(1, -1)
+    basis = np.sqrt(2 / size) * np.cos((2 * n + 1) * k * np.pi / (2 * size))
+    basis[0] /= np.sqrt(2)
+    basis = basis.astype(dtype)
+    # Shared between calls --> must never be modified
+    basis.setflags(write=False)
+    return basis
+
 #
 # These inverse DCT (= IDCT) methods are for verification purposes only!
 #
-def IDCT_2D(Y_blocks, Cb_blocks, Cr_blocks):
-    Y_blocks = Y_blocks.astype(np.float32)
-    Cb_blocks = Cb_blocks.astype(np.float32)
-    Cr_blocks = Cr_blocks.astype(np.float32)
+def IDCT_2D(Y_blocks, Cb_blocks, Cr_blocks, backend="matrix", dtype=np.float32):
+    return (idct_channel(Y_blocks, backend, dtype),
+            idct_channel(Cb_blocks, backend, dtype),
+            idct_channel(Cr_blocks, backend, dtype))
 
-    for channel_blocks in (Y_blocks, Cb_blocks, Cr_blocks):
+def idct_channel(channel_blocks, backend="matrix", dtype=np.float32):
+    channel_blocks = channel_blocks.astype(dtype)
+    if backend == "matrix":
+        # The basis is orthonormal --> its inverse is the transpose
+        basis = __dct_basis(channel_blocks.shape[-1], np.dtype(dtype))
+        return basis.T @ channel_blocks @ basis
+    if backend == "scipy":
+        return idctn(channel_blocks, axes=(2, 3), norm='ortho').astype(dtype, copy=False)
+    if backend == "reference":
         num_vertical, num_horizontal, block_height, block_width = channel_blocks.shape
         for i in range(num_vertical):
             for j in range(num_horizontal):
                 channel_blocks[i, j] = __IDCT_2D_per_block(channel_blocks[i, j])
-    return Y_blocks, Cb_blocks, Cr_blocks
+        return channel_blocks
+    raise ValueError(f"Unknown DCT backend '{backend}', expected one of {BACKENDS}")
 
 def __IDCT_2D_per_block(block):
     return idct(idct(block.T, norm='ortho').T, norm='ortho')
+
+#
+# Fixed-point integer AAN (Arai-Agui-Nakajima) DCT --> integer-only path (backend "aan")
+# Note: with NumPy, the butterflies (~45 array operations per pass) are SLOWER than the "matrix"
+# backend (one batched matmul), even with the quantization folded in --> "matrix" stays the default
+# Source: libjpeg's jfdctfst.c (separable 8-point AAN butterflies, rows first, then columns)
+#
+# The AAN butterflies do NOT produce the real DCT coefficients, but coefficients scaled by
+# AAN_SCALE[u] * AAN_SCALE[v] * AAN_OUTPUT_SCALE. These scale factors are folded into the
+# quantization tables (see Quantizer.aan_reciprocal_tables) --> one multiply per coefficient!
+#
+AAN_SCALE = np.array([1.0, 1.387039845, 1.306562965, 1.175875602,
+                      1.0, 0.785694958, 0.541196100, 0.275899379])
+# Fixed-point precision of the butterfly constants
+AAN_CONST_BITS = 13
+# Extra fractional bits kept between the row and the column pass
+AAN_PASS1_BITS = 2
+# Each 1D pass scales by sqrt(8) relative to the orthonormal DCT --> 8 in total,
+# and the input is scaled up by PASS1_BITS before the first pass
+AAN_OUTPUT_SCALE = 8 * (1 << AAN_PASS1_BITS)
+
+__FIX_0_382683433 = round(0.382683433 * (1 << AAN_CONST_BITS))
+__FIX_0_541196100 = round(0.541196100 * (1 << AAN_CONST_BITS))
+__FIX_0_707106781 = round(0.707106781 * (1 << AAN_CONST_BITS))
+__FIX_1_306562965 = round(1.306562965 * (1 << AAN_CONST_BITS))
+
+# Blocks transformed per pass of aan_channel --> the (8, 8, chunk) int32 planes stay in the CPU cache
+AAN_CHUNK_BLOCKS = 4096
+
+def AAN_DCT_2D(Y_blocks, Cb_blocks, Cr_blocks):
+    return aan_channel(Y_blocks), aan_channel(Cb_blocks), aan_channel(Cr_blocks)
+
+# Transform all level-shifted (nv, nh, 8, 8) blocks of one channel --> scaled int32 coefficients
+# reciprocal: AAN quantization table (see Quantizer.aan_reciprocal_tables) --> quantized right away,
+#             while the chunk is still in the cache (same result as Quantizer.quantize_aan_channel)
+# The blocks are processed in chunks, stored coefficient-major ("planar"): planes[r, c] holds
+# coefficient (r, c) of every block of the chunk --> each butterfly is one operation on a contiguous row
+def aan_channel(channel_blocks, reciprocal=None):
+    if channel_blocks.shape[-2:] != (8, 8):
+        raise ValueError(f"AAN DCT only supports 8x8 blocks, got {channel_blocks.shape[-2:]}")
+    flat = channel_blocks.reshape(-1, 64)
+    out = np.empty(flat.shape, dtype=np.int32)
+    chunk = min(AAN_CHUNK_BLOCKS, len(flat))
+    # Buffers are reused for every chunk
+    planes = np.empty((8, 8, chunk), dtype=np.int32)
+    rows = np.empty_like(planes)
+    if reciprocal is not None:
+        scaled = np.empty((8, 8, chunk), dtype=np.float32)
+        reciprocal = np.asarray(reciprocal, dtype=np.float32)[:, :, None]
+
+    for start in range(0, len(flat), AAN_CHUNK_BLOCKS):
+        count = min(AAN_CHUNK_BLOCKS, len(flat) - start)
+        data, row_data = planes[:, :, :count], rows[:, :, :count]
+        data[...] = flat[start:start + count].T.reshape(8, 8, count)
+        data <<= AAN_PASS1_BITS
+        # Row pass (along the column index c), then column pass (along the row index r)
+        __aan_1d(data.transpose(1, 0, 2), row_data.transpose(1, 0, 2))
+        __aan_1d(row_data, data)
+        if reciprocal is not None:
+            result = scaled[:, :, :count]
+            np.multiply(data, reciprocal, out=result)
+            np.rint(result, out=result)
+        else:
+            result = data
+        out[start:start + count] = result.reshape(64, count).T
+    return out.reshape(channel_blocks.shape)
+
+# Undo the AAN scale factors --> real DCT coefficients (e.g. for the IDCT verification)
+def aan_descale(channel_blocks):
+    return channel_blocks / (np.outer(AAN_SCALE, AAN_SCALE) * AAN_OUTPUT_SCALE)
+
+# Multiply by a fixed-point constant and scale back down (with rounding)
+def __aan_multiply(values, constant):
+    values = values * constant
+    values += 1 << (AAN_CONST_BITS - 1)
+    values >>= AAN_CONST_BITS
+    return values
+
+# One 8-point AAN pass: d[0..7] --> out[0..7] (arrays of the same shape, one per input/output index)
+def __aan_1d(d, out):
+    tmp0, tmp7 = d[0] + d[7], d[0] - d[7]
+    tmp1, tmp6 = d[1] + d[6], d[1] - d[6]
+    tmp2, tmp5 = d[2] + d[5], d[2] - d[5]
+    tmp3, tmp4 = d[3] + d[4], d[3] - d[4]
+
+    # Even part
+    tmp10, tmp13 = tmp0 + tmp3, tmp0 - tmp3
+    tmp11, tmp12 = tmp1 + tmp2, tmp1 - tmp2
+    np.add(tmp10, tmp11, out=out[0])
+    np.subtract(tmp10, tmp11, out=out[4])
+    z1 = __aan_multiply(tmp12 + tmp13, __FIX_0_707106781)
+    np.add(tmp13, z1, out=out[2])
+    np.subtract(tmp13, z1, out=out[6])
+
+    # Odd part
+    tmp10 = tmp4 + tmp5
+    tmp11 = tmp5 + tmp6
+    tmp12 = tmp6 + tmp7
+    z5 = __aan_multiply(tmp10 - tmp12, __FIX_0_382683433)
+    z2 = __aan_multiply(tmp10, __FIX_0_541196100)
+    z2 += z5
+    z4 = __aan_multiply(tmp12, __FIX_1_306562965)
+    z4 += z5
+    z3 = __aan_multiply(tmp11, __FIX_0_707106781)
+    z11, z13 = tmp7 + z3, tmp7 - z3
+    np.add(z13, z2, out=out[5])
+    np.subtract(z13, z2, out=out[3])
+    np.add(z11, z4, out=out[1])
+    np.subtract(z11, z4, out=out[7])
+
+# Compare the AAN backend against the float reference (DCT_2D + Quantizer.quantize_blocks)
+# Expects level-shifted blocks --> returns per channel:
+# - max_coefficient_error: max. absolute difference of the descaled AAN coefficients
+# - quantized_mismatch:    fraction of quantized coefficients that differ
+# - psnr_reference/psnr_aan: PSNR (in dB) of the dequantized + IDCT reconstruction vs. the input
+def aan_accuracy_report(Y_blocks, Cb_blocks, Cr_blocks, quantizer):
+    L_table, C_table = quantizer.scaled_tables()
+    reference = DCT_2D(Y_blocks, Cb_blocks, Cr_blocks, dtype=np.float64)
+    reference_q = quantizer.quantize_blocks(*reference)
+    aan = AAN_DCT_2D(Y_blocks, Cb_blocks, Cr_blocks)
+    aan_q = quantizer.quantize_aan_blocks(*aan)
+
+    report = {}
+    channels = zip(("Y", "Cb", "Cr"), (Y_blocks, Cb_blocks, Cr_blocks), reference, reference_q,
+                   aan, aan_q, (L_table, C_table, C_table))
+    for name, blocks, coefficients, quantized, aan_coefficients, aan_quantized, table in channels:
+        descaled = aan_descale(aan_coefficients)
+        report[name] = {
+            "max_coefficient_error": float(np.abs(descaled - coefficients).max(initial=0)),
+            "quantized_mismatch": float(np.mean(quantized != aan_quantized)) if quantized.size else 0.0,
+            "psnr_reference": __psnr(blocks, idct_channel(quantized * table, dtype=np.float64)),
+            "psnr_aan": __psnr(blocks, idct_channel(aan_quantized * table, dtype=np.float64)),
+        }
+    return report
+
+def __psnr(original, reconstructed):
+    mse = np.mean((original.astype(np.float64) - np.clip(np.round(reconstructed), -128, 127)) ** 2)
+    if mse == 0:
+        return float("inf")
+    return float(10 * np.log10(255 ** 2 / mse))
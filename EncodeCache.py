@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+# Bump whenever the encoder output changes --> old cache entries are never hit again (and age out)
+CACHE_VERSION = 2
+# Files are hashed in chunks --> constant memory for large sources
+HASH_CHUNK_SIZE = 1 << 20
+# Eviction goes down to this share of max_bytes --> the next directory scan only after ~10% new data
+EVICT_TARGET = 0.9
+# The running total is re-read from disk after this share of max_bytes was written by this instance
+# --> entries written by other workers are counted at the latest then (bounds the overshoot of a shared directory)
+RESCAN_SHARE = 0.1
+# Temporary files older than this were left behind by killed workers --> deleted on eviction
+STALE_TEMP_SECONDS = 3600
+
+# Use this class as an on-disk cache of finished JPEGs in front of the encoder
+# - key:      SHA-256 of the source (file bytes or pixels) + all settings that change the output
+#             (subsampling, block size, DCT backend, quality factor, Huffman table mode, restart interval)
+# - value:    the JPEG bytes, stored as <directory>/<key[:2]>/<key>.jpg
+# - eviction: least recently used first, once the cache exceeds max_bytes (a hit refreshes the
+#             file's modification time --> the file system keeps the LRU order, no index file needed)
+#             the cache size is kept as a running total (one directory scan at start, per eviction and
+#             after every RESCAN_SHARE * max_bytes written); entries written by other workers are only
+#             seen by the next scan --> workers sharing a directory may overshoot max_bytes by up to
+#             RESCAN_SHARE * max_bytes each until then (see main.encode_batch, which evicts once more at the end)
+# - writes are atomic (temporary file + rename) --> several worker processes can share one directory,
+#   readers never see half-written entries
+class EncodeCache:
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Bytes written since the last directory scan
+        self.__written = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Seeds the running total (+ clears what earlier runs left behind)
+        self.evict()
+
+    # Key of an image file --> only the raw file bytes are read (no decoding)
+    def file_key(self, path, config, block_size=8):
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return self.__key("file", digest.hexdigest(), config, block_size)
+
+    # Key of an (already opened) image --> hashes the decoded pixels
+    def image_key(self, image, config, block_size=8):
+        digest = hashlib.sha256(f"{image.mode}:{image.size}".encode())
+        digest.update(image.tobytes())
+        return self.__key("pixels", digest.hexdigest(), config, block_size)
+
+    # Cached JPEG bytes or None
+    def get(self, key):
+        path = self.__path(key)
+        try:
+            data = path.read_bytes()
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            # Never cached, or evicted (possibly by another worker) in the meantime
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self.__path(key)
+        path.parent.mkdir(exist_ok=True)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        # Write to a temporary file in the same directory, then rename --> atomic
+        file_descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.__total += len(data) - replaced
+        self.__written += len(data)
+        if self.__total > self.max_bytes or self.__written >= self.max_bytes * RESCAN_SHARE:
+            self.evict()
+
+    # Cache size in bytes as of the last directory scan + this instance's writes since then
+    @property
+    def size(self):
+        return self.__total
+
+    # Scan the cache directory once: delete stale temporary files, then the least recently used entries
+    # until the cache fits into EVICT_TARGET * max_bytes (temporary files of running writers count, too)
+    def evict(self):
+        entries = []
+        total = 0
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for path in self.directory.glob("*/*"):
+            try:
+                stat = path.stat()
+                if path.suffix == ".tmp" and stat.st_mtime < stale_before:
+                    path.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            total += stat.st_size
+            if path.suffix == ".jpg":
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        if total > self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes * EVICT_TARGET:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self.__total = total
+        self.__written = 0
+
+    def __key(self, source_kind, source_digest, config, block_size):
+        L, Ch, Cv = config.subsampling
+        settings = (f"v{CACHE_VERSION}|{source_kind}:{source_digest}|{L}:{Ch}:{Cv}|block{block_size}"
+                    f"|{config.dct_backend}|q{config.q_factor}|{config.table_mode}|rst{config.restart_interval}>={config.restart_min_pixels}")
+        return hashlib.sha256(settings.encode()).hexdigest()
+
+    def __path(self, key):
+        return self.directory / key[:2] / f"{key}.jpg"
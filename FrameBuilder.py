@@ -1,2 +1,123 @@
+import struct
+from pathlib import Path
+
+from ZigZagScanner import ZigZagScanner
+
+# JPEG markers
+SOI = 0xD8   # Start of Image
+APP0 = 0xE0  # Application segment 0 (JFIF)
+DQT = 0xDB   # Define Quantization Table(s)
+SOF0 = 0xC0  # Start of Frame (baseline DCT)
+DHT = 0xC4   # Define Huffman Table(s)
+SOS = 0xDA   # Start of Scan
+DRI = 0xDD   # Define Restart Interval
+RST0 = 0xD0  # Restart marker 0 (RST0 .. RST7 = 0xD0 .. 0xD7)
+EOI = 0xD9   # End of Image
+
+# Use this class to write the encoded data as a baseline JPEG (JFIF) file
+# --> every segment is written to the output as soon as it is available
+#     (no need to build the whole file in memory first)
+# Expects a file path or any writable binary stream (file, socket file, BytesIO, ...)
+# Usual order: start_of_image, define_quantization_tables, start_of_frame,
+# then per scan: define_huffman_tables, (define_restart_interval,) start_of_scan, write_scan_data;
+# finally end_of_image (write_headers: all segments before the scan data of a YCbCr image at once)
 class FrameBuilder:
-    pass
\ No newline at end of file
+    def __init__(self, output):
+        if hasattr(output, "write"):
+            self.stream = output
+            self.__owns_stream = False
+        else:
+            self.stream = open(Path(output), "wb")
+            self.__owns_stream = True
+        self.bytes_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Close the output, but only if this builder opened it
+    def close(self):
+        if self.__owns_stream:
+            self.stream.close()
+
+    # SOI + APP0 (JFIF 1.01, no units, 1:1 pixel aspect ratio, no thumbnail)
+    def start_of_image(self):
+        self.__write(struct.pack(">BB", 0xFF, SOI))
+        self.__write_segment(APP0, b"JFIF\x00" + struct.pack(">BBBHHBB", 1, 1, 0, 1, 1, 0, 0))
+
+    # DQT: luma table (id 0) and chroma table (id 1) of the quantizer
+    # --> 8-bit precision, stored in zigzag order
+    def define_quantization_tables(self, quantizer):
+        order = ZigZagScanner().zigzag_order(8)
+        payload = b""
+        for table_id, table in enumerate(quantizer.scaled_tables()):
+            payload += struct.pack(">B", table_id) + bytes(table.ravel()[order].astype(int).tolist())
+        self.__write_segment(DQT, payload)
+
+    # SOF0: image size + one (component_id, h_factor, v_factor, quant_table_id) tuple per component
+    def start_of_frame(self, width, height, components):
+        payload = struct.pack(">BHHB", 8, height, width, len(components))
+        for component_id, h_factor, v_factor, table_id in components:
+            payload += struct.pack(">BBB", component_id, (h_factor << 4) | v_factor, table_id)
+        self.__write_segment(SOF0, payload)
+
+    # DHT: DC (class 0) and AC (class 1) table of a table set with the given id
+    # --> tables as returned by HuffmanEncoder.build_tables
+    def define_huffman_tables(self, huffman_encoder, tables, table_id):
+        payload = b""
+        for table_class, key in enumerate(("DC", "AC")):
+            bits, huffval = huffman_encoder.dht_spec(tables[key])
+            payload += struct.pack(">B", (table_class << 4) | table_id) + bytes(bits) + bytes(huffval)
+        self.__write_segment(DHT, payload)
+
+    # DRI: number of MCUs per restart segment (0 = no restart markers --> no DRI segment at all)
+    # --> the entropy-coded data must contain the RSTn markers then (see HuffmanEncoder.encode_restart_stream)
+    def define_restart_interval(self, interval):
+        if not interval:
+            return
+        self.__write_segment(DRI, struct.pack(">H", interval))
+
+    # SOS: one (component_id, dc_table_id, ac_table_id) tuple per component of the scan
+    def start_of_scan(self, components):
+        payload = struct.pack(">B", len(components))
+        for component_id, dc_table_id, ac_table_id in components:
+            payload += struct.pack(">BB", component_id, (dc_table_id << 4) | ac_table_id)
+        # Spectral selection 0..63, no successive approximation --> baseline
+        payload += struct.pack(">BBB", 0, 63, 0)
+        self.__write_segment(SOS, payload)
+
+    # SOI .. SOS of a baseline YCbCr image with one interleaved scan
+    # --> Y: sampling factors h_factor x v_factor, quantization table 0, Huffman tables 0 (Y_tables)
+    # --> Cb, Cr: sampling factors 1 x 1, quantization table 1, Huffman tables 1 (C_tables)
+    # --> the scan data follows (write_scan_data)
+    def write_headers(self, width, height, quantizer, huffman_encoder, Y_tables, C_tables, h_factor, v_factor,
+                      restart_interval=0):
+        self.start_of_image()
+        self.define_quantization_tables(quantizer)
+        self.start_of_frame(width, height, [(1, h_factor, v_factor, 0), (2, 1, 1, 1), (3, 1, 1, 1)])
+        self.define_huffman_tables(huffman_encoder, Y_tables, 0)
+        self.define_huffman_tables(huffman_encoder, C_tables, 1)
+        self.define_restart_interval(restart_interval)
+        self.start_of_scan([(1, 0, 0), (2, 1, 1), (3, 1, 1)])
+
+    # Entropy-coded data (already byte stuffed, see BitWriter)
+    # --> accepts a single bytes object or an iterable of chunks
+    def write_scan_data(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = (data,)
+        for chunk in data:
+            self.__write(chunk)
+
+    def end_of_image(self):
+        self.__write(struct.pack(">BB", 0xFF, EOI))
+        self.stream.flush()
+
+    # Marker + 2-byte length (including the length field itself) + payload
+    def __write_segment(self, marker, payload):
+        self.__write(struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload)
+
+    def __write(self, data):
+        self.stream.write(data)
+        self.bytes_written += len(data)
@@ -0,0 +1,93 @@
+from Instrumentation import DISABLED
+from Quantizer import Quantizer
+from ZigZagScanner import ZigZagScanner
+from DifferentialEncoder import DifferentialEncoder
+from RunLengthEncoder import RunLengthEncoder
+from SymbolEncoder import SymbolEncoder, block_count
+from HuffmanEncoder import HuffmanEncoder
+from FrameBuilder import FrameBuilder
+
+# Quality-dependent tail of the pipeline, shared by main.encode_image and RateController:
+# quantization --> zigzag scan --> DC differences + AC run lengths --> Huffman tables --> interleaved scan
+# --> baseline JPEG frame
+# coefficients: DCT coefficients (Y, Cb, Cr) already padded to whole MCUs (ScanAssembler.pad_to_mcus)
+#               --> padding repeats whole blocks, so it commutes with quantization
+# assembler/Y_order: ScanAssembler of the subsampling mode and its luma_order for the image size
+# output: file path or writable binary stream (see FrameBuilder)
+# config: PipelineConfig --> Huffman table mode, restart interval, DCT backend, entropy executor, verbose
+# entropy_workers/entropy_pool: restart segment encoding, see HuffmanEncoder.encode_restart_stream
+# instruments/name: per-stage measurements (see Instrumentation)
+# preview: called with the quantized blocks (Y, Cb, Cr), e.g. to save the quantization previews
+# --> returns the number of bytes written
+def encode_frame(coefficients, q_factor, assembler, Y_order, width, height, output, config, entropy_workers=1,
+                 entropy_pool=None, instruments=DISABLED, name=None, preview=None):
+    restart_interval = config.restart_interval_for(width, height)
+
+    # Quantization (quantization table/matrix!)
+    with instruments.measure("Quantizer", name) as stage:
+        quantizer = Quantizer(q_factor)
+        Y_blocks, Cb_blocks, Cr_blocks = quantizer.quantize_blocks(*coefficients, backend=config.dct_backend)
+        stage.count(blocks=(Y_blocks.size + Cb_blocks.size + Cr_blocks.size) // 64)
+    if preview is not None:
+        preview(Y_blocks, Cb_blocks, Cr_blocks)
+
+    # Zigzag scan/ordering
+    with instruments.measure("ZigZagScanner", name) as stage:
+        scanner = ZigZagScanner()
+        Y_scan, Cb_scan, Cr_scan = scanner.zigzag_all_blocks(Y_blocks, Cb_blocks, Cr_blocks)
+        stage.count(blocks=len(Y_scan) + len(Cb_scan) + len(Cr_scan))
+    if config.verbose:
+        print(f"AFTER ZIGZAG: Y: {Y_scan}, Cb: {Cb_scan}, Cr: {Cr_scan}")
+
+    # Differential encoding (DC) --> separate predictor per channel,
+    # luma blocks are predicted in MCU order, predictors restart with every restart segment
+    with instruments.measure("DifferentialEncoder", name) as stage:
+        diff_encoder = DifferentialEncoder()
+        Y_diff, Cb_diff, Cr_diff = diff_encoder.differential_encode(Y_scan, Cb_scan, Cr_scan, Y_order,
+                                                                    restart_interval)
+        stage.count(blocks=len(Y_diff) + len(Cb_diff) + len(Cr_diff))
+
+    # Run-length Encoding (AC)
+    with instruments.measure("RunLengthEncoder", name) as stage:
+        rl_encoder = RunLengthEncoder()
+        Y_rle, Cb_rle, Cr_rle = rl_encoder.rl_encode_arrays(Y_diff, Cb_diff, Cr_diff)
+        stage.count(symbols=len(Y_rle) + len(Cb_rle) + len(Cr_rle))
+
+    # Symbol Encoding
+    with instruments.measure("SymbolEncoder", name) as stage:
+        symbol_encoder = SymbolEncoder()
+        Y_sym, Cb_sym, Cr_sym = symbol_encoder.encode(Y_rle, Cb_rle, Cr_rle)
+    if config.verbose:
+        print(f"Y: {Y_sym}, Cb: {Cb_sym}, Cr: {Cr_sym}")
+
+    # Huffman Encoding (Huffman tables!)
+    # --> "optimized": per-image tables (smaller files), "standard": Annex K tables (single pass)
+    # --> one table set for luma, one shared by Cb and Cr (built from both channels)
+    with instruments.measure("HuffmanEncoder.tables", name) as stage:
+        huffman_encoder = HuffmanEncoder(config.table_mode, verbose=config.verbose)
+        Y_tables = huffman_encoder.build_tables(Y_sym, "luma")
+        C_tables = huffman_encoder.build_shared_tables((Cb_sym, Cr_sym), "chroma")
+
+    # Interleave all channels into a single scan (MCU order)
+    with instruments.measure("ScanAssembler", name) as stage:
+        scan = assembler.interleave(Y_sym, Cb_sym, Cr_sym, Y_order)
+        stage.count(blocks=block_count(scan), symbols=len(scan))
+
+    # Frame builder --> construct JPEG encoded image!
+    with FrameBuilder(output) as frame_builder:
+        frame_builder.write_headers(width, height, quantizer, huffman_encoder, Y_tables, C_tables,
+                                    assembler.h_factor, assembler.v_factor, restart_interval)
+        # Entropy-coded data is written segment by segment while encoding
+        with instruments.measure("HuffmanEncoder.encode", name) as stage:
+            scan_tables = [Y_tables, C_tables, C_tables]
+            if restart_interval:
+                scan_data = huffman_encoder.encode_restart_stream(scan, scan_tables,
+                                                                  restart_interval * assembler.blocks_per_mcu,
+                                                                  entropy_workers, entropy_pool or config.entropy_executor)
+            else:
+                scan_data = huffman_encoder.encode_stream(scan, scan_tables)
+            header_bytes = frame_builder.bytes_written
+            frame_builder.write_scan_data(scan_data)
+            stage.count(symbols=len(scan), output_bits=(frame_builder.bytes_written - header_bytes) * 8)
+        frame_builder.end_of_image()
+    return frame_builder.bytes_written
@@ -1,31 +1,90 @@
-from matplotlib import pyplot as plt
-from PIL import Image, UnidentifiedImageError
+import os
+
+from PIL import Image
 from pathlib import Path
 
 #
 # This file only contains auxiliary functions --> prevent cluttering main method!
 # It is mainly used for loading/displaying/saving purposes
+# matplotlib is imported inside the plotting functions only --> slow import, not needed in production
 #
 
-# Fetch all images for JPEG encoding
-def get_images(src_dir: Path):
-    images = []
-    for filename in src_dir.iterdir():
+# File signatures ("magic bytes") of the supported source formats --> cheap check without decoding
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "PNG",
+    b"\xff\xd8\xff": "JPEG",
+    b"GIF87a": "GIF",
+    b"GIF89a": "GIF",
+    b"BM": "BMP",
+    b"II*\x00": "TIFF",
+    b"MM\x00*": "TIFF",
+}
+
+# Lightweight handle of an image file: only path and format are known,
+# the image itself is opened when the encoder actually needs it (see open)
+class ImageHandle:
+    def __init__(self, path: Path, image_format: str):
+        self.path = path
+        self.format = image_format
+
+    # Same attribute as on PIL images --> handles can be used wherever only the file name is needed
+    @property
+    def filename(self):
+        return str(self.path)
+
+    # Open the image (lazily, PIL only reads the header here) --> use as context manager to close it again
+    def open(self):
+        return Image.open(self.path)
+
+    def __repr__(self):
+        return f"ImageHandle('{self.path}', {self.format})"
+
+# Fetch all images for JPEG encoding --> generator, yields one ImageHandle per image file
+# Files are only sniffed (first bytes), NOT opened as images --> no open files, no decoding up front
+# extensions: optional set of allowed suffixes, e.g. {".png", ".jpg"} (case-insensitive)
+# recursive: also walk all subdirectories (lazily, one directory at a time --> the first handles
+#            are yielded before the whole tree is listed; order: a directory's files, then its subdirectories,
+#            both sorted by name)
+def get_images(src_dir: Path, extensions=None, recursive=False):
+    if extensions is not None:
+        extensions = {extension.lower() for extension in extensions}
+    filenames = __walk_files(src_dir) if recursive else sorted(src_dir.iterdir())
+    for filename in filenames:
         # Skip iteration if it is not a 'regular' file
         if not filename.is_file():
             continue
-        # Else treat as image
+        if extensions is not None and filename.suffix.lower() not in extensions:
+            continue
+        # Else check the header --> only then yield a handle
         try:
-            # Check if image --> only then append to list
-            with Image.open(filename) as image:
-                image.verify()
-                print(f"opened image {image.filename}")
-                images.append(Image.open(filename) )
-
-        # Print error if not image or other problem
-        except (UnidentifiedImageError, FileNotFoundError) as e:
+            image_format = sniff_image_format(filename)
+        except OSError as e:
             print(e)
-    return images
+            continue
+        if image_format is None:
+            print(f"skipped '{filename}': not a supported image file")
+            continue
+        yield ImageHandle(filename, image_format)
+
+# All files below directory --> generator, sorted per directory
+def __walk_files(directory: Path):
+    for root, dirnames, filenames in os.walk(directory):
+        # Sorting in place also fixes the order in which os.walk descends
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield Path(root) / filename
+
+# Format of an image file according to its signature (None if unknown)
+def sniff_image_format(path: Path):
+    with open(path, "rb") as file:
+        header = file.read(16)
+    # WEBP: RIFF container with "WEBP" at offset 8
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
 
 # Save the resulting image at path
 def save_image(image: Image.Image, path: Path):
@@ -33,6 +92,7 @@ def save_image(image: Image.Image, path: Path):
 
 # Saves a matplotlib figure showing Y, subsampled Cb/Cr, upsampled Cb/Cr
 def save_subsample_plot(Y, Cb, Cr, Cb_up, Cr_up, output_file):
+    from matplotlib import pyplot as plt
     fig, axes = plt.subplots(2, 3, figsize=(15, 8))
 
     axes[0, 0].imshow(Y, cmap="gray", vmin=0, vmax=255)
@@ -66,6 +126,7 @@ def save_subsample_plot(Y, Cb, Cr, Cb_up, Cr_up, output_file):
 
 # Saves (a portion of) blocks and displays them in a figure
 def show_blocks(blocks, output_file, title, min=None, max=None):
+    from matplotlib import pyplot as plt
     num_vertical, num_horizontal, block_height, block_width = blocks.shape
     fig, axes = plt.subplots(num_vertical, num_horizontal, figsize=(num_horizontal, num_vertical))
 
@@ -1,129 +1,304 @@
-from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
 import heapq
 
+import numpy as np
+
+from BitWriter import BitWriter
+from FrameBuilder import RST0
+from HuffmanTable import HuffmanTable
+from SymbolEncoder import block_offsets, dc_mask
+
+# Placeholder symbol that reserves the all-ones code (JPEG forbids codes consisting of 1-bits only)
+RESERVED_SYMBOL = 256
+# JPEG limit for Huffman code lengths
+MAX_CODE_LENGTH = 16
+
+# Standard Huffman tables (JPEG Annex K.3) as BITS (number of codes per length 1..16) + HUFFVAL
+DC_LUMINANCE_BITS = [0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0]
+DC_LUMINANCE_VALUES = list(range(12))
+
+DC_CHROMINANCE_BITS = [0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0]
+DC_CHROMINANCE_VALUES = list(range(12))
+
+AC_LUMINANCE_BITS = [0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7D]
+AC_LUMINANCE_VALUES = [
+    0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12, 0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+    0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xA1, 0x08, 0x23, 0x42, 0xB1, 0xC1, 0x15, 0x52, 0xD1, 0xF0,
+    0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0A, 0x16, 0x17, 0x18, 0x19, 0x1A, 0x25, 0x26, 0x27, 0x28,
+    0x29, 0x2A, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3A, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48, 0x49,
+    0x4A, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69,
+    0x6A, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7A, 0x83, 0x84, 0x85, 0x86, 0x87, 0x88, 0x89,
+    0x8A, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9A, 0xA2, 0xA3, 0xA4, 0xA5, 0xA6, 0xA7,
+    0xA8, 0xA9, 0xAA, 0xB2, 0xB3, 0xB4, 0xB5, 0xB6, 0xB7, 0xB8, 0xB9, 0xBA, 0xC2, 0xC3, 0xC4, 0xC5,
+    0xC6, 0xC7, 0xC8, 0xC9, 0xCA, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9, 0xDA, 0xE1, 0xE2,
+    0xE3, 0xE4, 0xE5, 0xE6, 0xE7, 0xE8, 0xE9, 0xEA, 0xF1, 0xF2, 0xF3, 0xF4, 0xF5, 0xF6, 0xF7, 0xF8,
+    0xF9, 0xFA
+]
+
+AC_CHROMINANCE_BITS = [0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77]
+AC_CHROMINANCE_VALUES = [
+    0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21, 0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+    0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91, 0xA1, 0xB1, 0xC1, 0x09, 0x23, 0x33, 0x52, 0xF0,
+    0x15, 0x62, 0x72, 0xD1, 0x0A, 0x16, 0x24, 0x34, 0xE1, 0x25, 0xF1, 0x17, 0x18, 0x19, 0x1A, 0x26,
+    0x27, 0x28, 0x29, 0x2A, 0x35, 0x36, 0x37, 0x38, 0x39, 0x3A, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48,
+    0x49, 0x4A, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59, 0x5A, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68,
+    0x69, 0x6A, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79, 0x7A, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87,
+    0x88, 0x89, 0x8A, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98, 0x99, 0x9A, 0xA2, 0xA3, 0xA4, 0xA5,
+    0xA6, 0xA7, 0xA8, 0xA9, 0xAA, 0xB2, 0xB3, 0xB4, 0xB5, 0xB6, 0xB7, 0xB8, 0xB9, 0xBA, 0xC2, 0xC3,
+    0xC4, 0xC5, 0xC6, 0xC7, 0xC8, 0xC9, 0xCA, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9, 0xDA,
+    0xE2, 0xE3, 0xE4, 0xE5, 0xE6, 0xE7, 0xE8, 0xE9, 0xEA, 0xF2, 0xF3, 0xF4, 0xF5, 0xF6, 0xF7, 0xF8,
+    0xF9, 0xFA
+]
+
+# Lookup tables of the standard tables --> built once at import
+STANDARD_TABLES = {
+    "luma": {
+        "DC": HuffmanTable(DC_LUMINANCE_BITS, DC_LUMINANCE_VALUES),
+        "AC": HuffmanTable(AC_LUMINANCE_BITS, AC_LUMINANCE_VALUES),
+    },
+    "chroma": {
+        "DC": HuffmanTable(DC_CHROMINANCE_BITS, DC_CHROMINANCE_VALUES),
+        "AC": HuffmanTable(AC_CHROMINANCE_BITS, AC_CHROMINANCE_VALUES),
+    },
+}
+
+# Table modes:
+# - "optimized": per-image tables built from the symbol frequencies --> smaller files,
+#                but needs a full first pass over all symbols before encoding
+# - "standard":  the Annex K tables --> no frequency pass, blocks can be encoded as they come
+TABLE_MODES = ("optimized", "standard")
+
+# Worker pools for encoding restart segments in parallel (see encode_restart_stream)
+EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
 class HuffmanEncoder:
+    # verbose: print the built tables (diagnostics only)
+    def __init__(self, table_mode="optimized", verbose=False):
+        if table_mode not in TABLE_MODES:
+            raise ValueError(f"Unknown Huffman table mode '{table_mode}', expected one of {TABLE_MODES}")
+        self.table_mode = table_mode
+        self.verbose = verbose
 
-    # Build a Huffman table for a list of symbols
-    # --> Symbols can be AC or DC
-    # --> return mapping of symbol to Huffman code (in a dictionary)
-    # --> ENSURE no code exceeds 16 bits (JPEG-compliant)
-    def __build_table(self, symbols):
+    # Build a Huffman table from a symbol histogram (JPEG Annex K.2 + K.3)
+    # --> histogram[symbol] = how often the symbol byte occurs (more frequent symbols get shorter codes!)
+    # --> returns a HuffmanTable: canonical codes, lookup arrays and BITS/HUFFVAL for the DHT segment
+    # --> ENSURE no code exceeds 16 bits and no code consists of 1-bits only (JPEG-compliant)
+    def build_table(self, histogram):
+        # The reserved symbol gets a count of 1 --> it takes one of the longest codes,
+        # which is removed again at the end (so the all-ones code stays unused)
+        freq = np.zeros(RESERVED_SYMBOL + 1, dtype=np.int64)
+        freq[:len(histogram)] = histogram
+        freq[RESERVED_SYMBOL] = 1
+        symbols = np.flatnonzero(freq)
 
-        # Count how often each symbol appears
-        # --> more frequent symbols will get shorter Huffman codes!
-        freq = Counter(symbols)
+        code_sizes = self.__code_sizes(freq[symbols])
 
-        # Sort symbols by frequency ascending (least frequent first)
-        # --> x[1] refers to the frequency, x[0] is the symbol
-        sorted_symbols = sorted(freq.items(), key=lambda x: x[1])
+        # BITS[i] = number of codes of length i
+        bits = np.bincount(code_sizes, minlength=MAX_CODE_LENGTH + 1).tolist()
+        bits = self.__adjust_bits(bits)
 
-        # Initialize code lengths: all start at 0
-        code_lengths = {symbol: 0 for symbol, _ in sorted_symbols}
+        # HUFFVAL: real symbols sorted by code size, then by value (Annex K.2, Sort_input)
+        # --> the adjusted lengths are handed out in this order
+        order = np.lexsort((symbols, code_sizes))
+        huffval = [int(symbol) for symbol in symbols[order] if symbol != RESERVED_SYMBOL]
+        return HuffmanTable(bits[1:MAX_CODE_LENGTH + 1], huffval)
 
-        # Build a  Huffman tree using heap
-        # In the beginning, all codes are empty --> will be filled with 0/1
-        heap = [[weight, [[symbol, ""]]] for symbol, weight in sorted_symbols]
+    # Code size of each symbol = depth of its leaf in the Huffman tree
+    # Only parent links are stored during the merges --> O(n log n), no code strings are built
+    def __code_sizes(self, weights):
+        num_leaves = len(weights)
+        if num_leaves == 1:
+            return np.ones(1, dtype=np.int64)
+
+        # Nodes 0 .. n-1 are the leaves, every merge creates a new node
+        parent = np.zeros(2 * num_leaves - 1, dtype=np.int64)
+        # Ties are broken by node id --> deterministic tables
+        heap = [(int(weight), node) for node, weight in enumerate(weights)]
         heapq.heapify(heap)
 
         # Repeatedly merge the two least frequent nodes
         # until only one tree remains
+        next_node = num_leaves
         while len(heap) > 1:
-            # Pop two nodes with smallest frequency
-            lo = heapq.heappop(heap)
-            hi = heapq.heappop(heap)
-
-            # Prefix '0' to all codes in the left subtree
-            for entry in lo[1]:
-                entry[1] = '0' + entry[1]
-                code_lengths[entry[0]] += 1
-
-            # Prefix '1' to all codes in the right subtree
-            for entry in hi[1]:
-                entry[1] = '1' + entry[1]
-                code_lengths[entry[0]] += 1
-
-            # Push merged node back into the heap
-            # Frequencies add up, symbol lists concatenate
-            heapq.heappush(
-                heap,
-                [lo[0] + hi[0], lo[1] + hi[1]]
-            )
-
-        # Extract preliminary symbol -> code mapping
-        # Heap now looks like this: [ total_frequency, [ [symbol, code], [symbol, code], ... ] ]
-        # --> heap[0][1] contains [symbol, code] pairs
-        # --> build dictionary from that!
-        temp_table = {symbol: code for symbol, code in heap[0][1]}
-
-        # --- ENFORCE JPEG MAX CODE LENGTH = 16 ---
-        MAX_LEN = 16  # JPEG limit
-        # Find symbols exceeding MAX_LEN
-        over_len = {symbol: length for symbol, length in code_lengths.items() if length > MAX_LEN}
-
-        if over_len:
-            # Simple redistribution: move extra symbols to max length
-            for symbol in over_len:
-                # Truncate code to 16 bits (rightmost bits kept)
-                temp_table[symbol] = temp_table[symbol][-MAX_LEN:]
-                code_lengths[symbol] = MAX_LEN
-
-        # Final table ready
-        return temp_table
+            lo_weight, lo = heapq.heappop(heap)
+            hi_weight, hi = heapq.heappop(heap)
+            parent[lo] = parent[hi] = next_node
+            heapq.heappush(heap, (lo_weight + hi_weight, next_node))
+            next_node += 1
+
+        # Parents are always created after their children --> walk from the root (last node) down
+        depth = np.zeros(2 * num_leaves - 1, dtype=np.int64)
+        for node in range(2 * num_leaves - 3, -1, -1):
+            depth[node] = depth[parent[node]] + 1
+        return depth[:num_leaves]
 
+    # Shorten all codes to at most MAX_CODE_LENGTH bits (JPEG Annex K.3, Adjust_BITS):
+    # two symbols of the longest length are replaced by one symbol of the next shorter length
+    # plus two symbols one bit longer than the longest length below --> keeps a valid prefix code
+    # (simply cutting codes off does NOT, the cut codes collide with others!)
+    # Afterwards the code of the reserved symbol (one of the longest) is removed
+    def __adjust_bits(self, bits):
+        bits = bits + [0] * (MAX_CODE_LENGTH + 1 - len(bits))
+        i = len(bits) - 1
+        while i > MAX_CODE_LENGTH:
+            while bits[i] > 0:
+                j = i - 2
+                while bits[j] == 0:
+                    j -= 1
+                bits[i] -= 2
+                bits[i - 1] += 1
+                bits[j + 1] += 2
+                bits[j] -= 1
+            i -= 1
+
+        # Remove the reserved code point from the longest code length
+        while bits[i] == 0:
+            i -= 1
+        bits[i] -= 1
+        return bits
+
+    # Describe a table the way a DHT segment stores it:
+    # - BITS: number of codes of each length 1..16
+    # - HUFFVAL: symbols sorted by code
+    def dht_spec(self, table):
+        return table.bits, table.huffval
 
     # Construct the tables from the provided blocks
-    def build_tables(self, blocks):
-        dc_symbols = []
-        ac_symbols = []
-
-        for block in blocks:
-            # DC: size only
-            dc_size, _ = block['DC']
-            dc_symbols.append(dc_size)
-
-            # AC symbols
-            for ac in block['AC']:
-                #if ac == ('ZRL',) or ac == ('EOB',):
-                #    ac_symbols.append(ac)
-                if (ac == (15,0)):
-                    ac_symbols.append((15,0))
-                elif(ac == (0,0)):
-                    ac_symbols.append((0,0))
-                else:
-                    (run, size), _ = ac
-                    ac_symbols.append((run, size))
-
-        dc_table = self.__build_table(dc_symbols)
-        ac_table = self.__build_table(ac_symbols)
-        print(f"DC Table: {dc_table}")
-        print(f"AC Table: {ac_table}")
+    # --> symbols are JPEG symbol bytes: DC: SIZE, AC: RUN << 4 | SIZE
+    # --> blocks are a symbol stream (see SymbolEncoder.SYMBOL_DTYPE)
+    # --> component ("luma"/"chroma") selects the Annex K tables in "standard" mode,
+    #     the blocks are not even looked at then
+    def build_tables(self, blocks, component="luma"):
+        if self.table_mode == "standard":
+            return STANDARD_TABLES[component]
+
+        dc_histogram, ac_histogram = self.symbol_histograms(blocks)
+        dc_table = self.build_table(dc_histogram)
+        ac_table = self.build_table(ac_histogram)
+        if self.verbose:
+            print(f"DC Table: {dc_table}")
+            print(f"AC Table: {ac_table}")
         return { "DC": dc_table, "AC": ac_table }
 
+    # Build one table set for several channels together, e.g. Cb + Cr
+    # --> baseline JPEG has room for two table sets only (luma + chroma)
+    def build_shared_tables(self, channels, component="chroma"):
+        if self.table_mode == "standard":
+            return STANDARD_TABLES[component]
+
+        histograms = [self.symbol_histograms(blocks) for blocks in channels]
+        dc_table = self.build_table(sum(dc_histogram for dc_histogram, _ in histograms))
+        ac_table = self.build_table(sum(ac_histogram for _, ac_histogram in histograms))
+        if self.verbose:
+            print(f"DC Table: {dc_table}")
+            print(f"AC Table: {ac_table}")
+        return { "DC": dc_table, "AC": ac_table }
+
+    # Count how often each DC/AC symbol byte occurs --> two histograms of length 256
+    # --> AC symbols include ZRL = 0xF0 and EOB = 0x00
+    def symbol_histograms(self, blocks):
+        is_dc = dc_mask(blocks)
+        symbols = blocks["symbol"]
+        return (np.bincount(symbols[is_dc], minlength=256),
+                np.bincount(symbols[~is_dc], minlength=256))
+
     # Encode individual blocks  --> treat
     # AC and DC components separately -->
     # Now we need the encoded bits from the previously generated Huffman tables!
+    # --> returns the entropy-coded bytes (byte stuffed, padded with 1-bits)
     def encode_bitstream(self, blocks, tables):
-        bitstream = ""
-        dc_table = tables['DC']
-        ac_table = tables['AC']
-
-        for block in blocks:
-            size, bits = block['DC']
-            bitstream += dc_table[size]
-            bitstream += bits
-
-            for ac in block['AC']:
-                #if ac == ('ZRL',) or ac == ('EOB',):
-                #    bitstream += ac_table[ac]
-                if (ac == (15,0)):
-                    bitstream += ac_table[(15,0)]
-                elif(ac == (0,0)):
-                    bitstream += ac_table[(0,0)]
-                else:
-                    (run, size), bits = ac
-                    bitstream += ac_table[(run, size)]
-                    bitstream += bits
-
-        print(f"Bitstream: {bitstream}")
-        return bitstream
+        return b"".join(self.encode_stream(blocks, tables))
+
+    # Same as encode_bitstream, but yields the bytes in chunks of <chunk_blocks> blocks
+    # --> together with the "standard" tables, the output can be written (e.g. by FrameBuilder)
+    #     while the blocks are still being encoded, in a single pass
+    # --> for an interleaved scan (see ScanAssembler.interleave), tables is a list of table sets
+    #     indexed by the "component" field of each symbol
+    def encode_stream(self, blocks, tables, chunk_blocks=4096):
+        writer = BitWriter()
+        offsets = block_offsets(blocks)
+        num_blocks = len(offsets) - 1
+        for start in range(0, num_blocks, chunk_blocks):
+            self.__encode_arrays(writer, blocks[offsets[start]:offsets[min(start + chunk_blocks, num_blocks)]], tables)
+            yield writer.take()
+        yield writer.flush()
+
+    # Encode a scan with restart markers: every <blocks_per_interval> blocks (restart interval in
+    # MCUs * blocks per MCU) the entropy coder starts over on a byte boundary --> the segments are
+    # independent of each other and are encoded by a pool of <workers> threads or processes
+    # (the DC predictors must be reset per segment as well, see DifferentialEncoder)
+    # --> yields the segments in order, separated by the markers RST0, RST1, ..., RST7, RST0, ...
+    # executor: "thread"/"process" --> a new pool for this call, or a long-lived Executor (e.g. one per
+    #           batch, see main.encode_image) that is reused and left open; workers = its size then
+    def encode_restart_stream(self, blocks, tables, blocks_per_interval, workers=1, executor="thread"):
+        if not isinstance(executor, Executor) and executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor '{executor}', expected one of {tuple(EXECUTORS)}")
+        # Segment bounds as symbol positions
+        offsets = block_offsets(blocks)
+        num_blocks = len(offsets) - 1
+        bounds = [int(offsets[block]) for block in range(0, num_blocks, blocks_per_interval)] + [len(blocks)]
+        segments = list(zip(bounds[:-1], bounds[1:]))
+
+        # Several segments per task --> less scheduling overhead, enough tasks to balance the load
+        per_task = max(1, len(segments) // (4 * max(workers, 1)))
+        tasks = [segments[i:i + per_task] for i in range(0, len(segments), per_task)]
+        # Each task only receives its own part of the stream (matters for processes)
+        task_blocks = [blocks[task[0][0]:task[-1][1]] for task in tasks]
+        task_segments = [[(start - task[0][0], end - task[0][0]) for start, end in task] for task in tasks]
+
+        if workers <= 1:
+            results = map(_encode_segments, task_blocks, [tables] * len(tasks), task_segments)
+            yield from self.__join_segments(results)
+            return
+
+        pool = executor if isinstance(executor, Executor) else EXECUTORS[executor](max_workers=workers)
+        # A given executor is left open for the caller
+        with (contextlib.nullcontext(pool) if pool is executor else pool):
+            # map keeps the order of the tasks
+            results = pool.map(_encode_segments, task_blocks, [tables] * len(tasks), task_segments)
+            yield from self.__join_segments(results)
+
+    def __join_segments(self, results):
+        index = 0
+        for task_result in results:
+            for segment in task_result:
+                if index > 0:
+                    yield bytes((0xFF, RST0 + (index - 1) % 8))
+                yield segment
+                index += 1
+
+    # Vectorized encoding of whole blocks of a symbol stream: look up all codes at once,
+    # then interleave them with the amplitude bits
+    def __encode_arrays(self, writer, blocks, tables):
+        symbols = blocks["symbol"]
+
+        # Row 0 of the lookup arrays holds the AC codes, row 1 the DC codes
+        is_dc = dc_mask(blocks).view(np.uint8)
+        if isinstance(tables, dict):
+            tables = [tables]
+            table_index = np.zeros(len(symbols), dtype=np.intp)
+        else:
+            table_index = blocks["component"]
+        code_lut = np.array([[table_set['AC'].codes, table_set['DC'].codes] for table_set in tables])
+        length_lut = np.array([[table_set['AC'].lengths, table_set['DC'].lengths] for table_set in tables])
+
+        code_lengths = length_lut[table_index, is_dc, symbols]
+        if not code_lengths.all():
+            missing = symbols[code_lengths == 0][0]
+            raise ValueError(f"Symbol 0x{missing:02X} has no code in the Huffman table")
+
+        values = np.empty(2 * len(symbols), dtype=np.uint32)
+        lengths = np.empty(2 * len(symbols), dtype=np.uint8)
+        values[0::2] = code_lut[table_index, is_dc, symbols]
+        lengths[0::2] = code_lengths
+        values[1::2] = blocks["bits"]
+        lengths[1::2] = blocks["length"]
+        writer.write_arrays(values, lengths)
+
 
+# Worker task: encode each (start, end) symbol range separately --> byte-aligned results
+# (module level function, so that it can be sent to worker processes)
+def _encode_segments(blocks, tables, segments):
+    encoder = HuffmanEncoder()
+    return [encoder.encode_bitstream(blocks[start:end], tables) for start, end in segments]
@@ -0,0 +1,50 @@
+import numpy as np
+
+# Use this class to store one Huffman table (DC or AC) in the form JPEG uses it:
+# - BITS:    number of codes of each length 1..16
+# - HUFFVAL: symbol bytes sorted by code
+# The canonical codes (JPEG Annex C) are derived from these two lists and kept as lookup arrays
+# --> codes[symbol] / lengths[symbol] can be indexed directly with whole symbol arrays
+class HuffmanTable:
+    def __init__(self, bits, huffval):
+        if len(bits) != 16 or sum(bits) != len(huffval):
+            raise ValueError(f"Invalid Huffman table: {sum(bits)} codes for {len(huffval)} symbols")
+        self.bits = list(bits)
+        self.huffval = list(huffval)
+
+        # length 0 --> symbol has no code in this table
+        self.codes = np.zeros(256, dtype=np.uint32)
+        self.lengths = np.zeros(256, dtype=np.uint8)
+
+        # Canonical codes: each code is the previous one + 1, shifted left when the length grows
+        code = 0
+        symbols = iter(self.huffval)
+        for length, count in enumerate(self.bits, start=1):
+            for _ in range(count):
+                symbol = next(symbols)
+                self.codes[symbol] = code
+                self.lengths[symbol] = length
+                code += 1
+            # JPEG forbids a code consisting of 1-bits only
+            if code >= (1 << length):
+                raise ValueError(f"Invalid Huffman table: too many codes of length {length}")
+            code <<= 1
+
+        # Shared between encoders --> must never be modified
+        self.codes.setflags(write=False)
+        self.lengths.setflags(write=False)
+
+    # Dictionary-like access: symbol --> (code, length)
+    def __getitem__(self, symbol):
+        if self.lengths[symbol] == 0:
+            raise KeyError(symbol)
+        return int(self.codes[symbol]), int(self.lengths[symbol])
+
+    def __contains__(self, symbol):
+        return 0 <= symbol < 256 and self.lengths[symbol] > 0
+
+    def items(self):
+        return ((symbol, self[symbol]) for symbol in self.huffval)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
@@ -0,0 +1,120 @@
+import json
+import os
+import time
+import tracemalloc
+
+# Use this class to measure the stages of the encoder pipeline (see main.encode_image):
+#
+#   with instruments.measure("DCT_2D", image_name) as stage:
+#       Y_blocks, Cb_blocks, Cr_blocks = DCT_2D(Y_blocks, Cb_blocks, Cr_blocks)
+#       stage.count(blocks=Y_blocks.size // 64)
+#
+# Per stage and image one record (dict) is kept:
+# - wall_s:     elapsed time (perf_counter)
+# - cpu_s:      CPU time of the whole process (incl. worker threads, e.g. the entropy coder)
+# - child_cpu_s: CPU time of child processes that exited during the stage (os.times), e.g. a
+#               per-image process pool of the entropy coder --> children of a long-lived pool are only
+#               counted once they exit, i.e. in the stage that shuts the pool down
+# - peak_bytes: peak of the memory allocated during the stage (tracemalloc, only if trace_memory)
+# - counts:     whatever the stage reports, e.g. blocks, symbols, output bits
+# Disabled --> measure returns a shared do-nothing stage (no timers, no allocations)
+class Instrumentation:
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.records = []
+        # Only stop tracemalloc again if it was started here
+        self.__started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.__started_tracing = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def measure(self, stage, image=None):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, stage, image)
+
+    def close(self):
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+# One running measurement (context manager returned by Instrumentation.measure)
+class _Stage:
+    def __init__(self, instruments, stage, image):
+        self.__instruments = instruments
+        self.record = {"image": image, "stage": stage, "counts": {}}
+
+    def count(self, **counts):
+        self.record["counts"].update({key: int(value) for key, value in counts.items()})
+
+    def __enter__(self):
+        if self.__instruments.trace_memory:
+            tracemalloc.reset_peak()
+            self.__memory_start = tracemalloc.get_traced_memory()[0]
+        self.__cpu_start = time.process_time()
+        self.__child_cpu_start = _child_cpu_time()
+        self.__wall_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record["wall_s"] = time.perf_counter() - self.__wall_start
+        self.record["cpu_s"] = time.process_time() - self.__cpu_start
+        self.record["child_cpu_s"] = _child_cpu_time() - self.__child_cpu_start
+        if self.__instruments.trace_memory:
+            self.record["peak_bytes"] = max(tracemalloc.get_traced_memory()[1] - self.__memory_start, 0)
+        self.__instruments.records.append(self.record)
+
+# User + system time of all terminated (and waited for) child processes
+def _child_cpu_time():
+    times = os.times()
+    return times.children_user + times.children_system
+
+# Stand-in if the instrumentation is disabled
+class _NullStage:
+    def count(self, **counts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_NULL_STAGE = _NullStage()
+# Shared disabled instance --> default wherever no instrumentation is passed in
+DISABLED = Instrumentation(enabled=False)
+
+# Append the records to a JSON lines file (one record per line)
+def write_jsonl(records, path):
+    with open(path, "a") as file:
+        for record in records:
+            file.write(json.dumps(record) + "\n")
+
+# Summary table over all images: totals per stage (in the order the stages first appear)
+def summary_table(records):
+    stages = {}
+    for record in records:
+        total = stages.setdefault(record["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "child_cpu_s": 0.0,
+                                                   "peak_bytes": 0, "counts": {}})
+        total["calls"] += 1
+        total["wall_s"] += record["wall_s"]
+        total["cpu_s"] += record["cpu_s"]
+        total["child_cpu_s"] += record.get("child_cpu_s", 0.0)
+        total["peak_bytes"] = max(total["peak_bytes"], record.get("peak_bytes", 0))
+        for key, value in record["counts"].items():
+            total["counts"][key] = total["counts"].get(key, 0) + value
+
+    all_wall = sum(total["wall_s"] for total in stages.values()) or 1.0
+    lines = [f"{'stage':<24}{'calls':>6}{'wall [s]':>11}{'share':>8}{'cpu [s]':>10}{'child cpu':>11}{'peak [MB]':>11}  counts"]
+    for stage, total in stages.items():
+        counts = ", ".join(f"{key}={value}" for key, value in total["counts"].items())
+        lines.append(f"{stage:<24}{total['calls']:>6}{total['wall_s']:>11.4f}{total['wall_s'] / all_wall:>8.1%}"
+                     f"{total['cpu_s']:>10.4f}{total['child_cpu_s']:>11.4f}{total['peak_bytes'] / 1e6:>11.2f}  {counts}")
+    return "\n".join(lines)
@@ -6,29 +6,36 @@ class LevelShifter:
 
     # Shift block values from [0, 255] to [-128,127] for DCT!
     def shift(self, Y_blocks, Cb_blocks, Cr_blocks):
-        # Need to transform base datatype -->
-        # from dtype=uint8 (unsigned 8-bit integers) to int16 -->
-        # otherwise level shift will NOT work!
-        Y_blocks = Y_blocks.astype(np.int16)
-        Cb_blocks = Cb_blocks.astype(np.int16)
-        Cr_blocks = Cr_blocks.astype(np.int16)
-        for channel_blocks in (Y_blocks, Cb_blocks, Cr_blocks):
-            for blocks in channel_blocks:
-                for block in blocks:
-                    h, w = block.shape
-                    for i in range(h):
-                        for j in range(w):
-                            block[i, j] = block[i, j] - self.level
-        self.__verify_blocks(Y_blocks, Cb_blocks, Cr_blocks)
+        Y_blocks = self.shift_channel(Y_blocks)
+        Cb_blocks = self.shift_channel(Cb_blocks)
+        Cr_blocks = self.shift_channel(Cr_blocks)
         return Y_blocks, Cb_blocks, Cr_blocks
 
+    # Whole-array mode: shift all (nv, nh, 8, 8) blocks of one channel at once
+    # and check the range in the same pass --> no per-pixel Python loops!
+    # If 'out' is given (an int16 array of the same shape), the result is written
+    # into it directly --> no extra copy per channel (out may also be the input itself)
+    def shift_channel(self, channel_blocks, out=None):
+        if out is None:
+            # Need to transform base datatype -->
+            # from dtype=uint8 (unsigned 8-bit integers) to int16 -->
+            # otherwise level shift will NOT work!
+            out = np.empty(channel_blocks.shape, dtype=np.int16)
+        elif out.dtype != np.int16 or out.shape != channel_blocks.shape:
+            raise ValueError(f"Expected int16 buffer of shape {channel_blocks.shape}, "
+                             f"got {out.dtype} buffer of shape {out.shape}")
+
+        # dtype=int16 --> uint8 input is widened and subtracted directly into the int16 buffer
+        np.subtract(channel_blocks, self.level, out=out, dtype=np.int16, casting='unsafe')
+        self.__verify_channel(out)
+        return out
+
     # Just in case: Check whether all block values are in the target range!
-    def __verify_blocks(self, Y_blocks, Cb_blocks, Cr_blocks):
-        for channel_blocks in (Y_blocks, Cb_blocks, Cr_blocks):
-            for blocks in channel_blocks:
-                for block in blocks:
-                    h, w = block.shape
-                    for i in range(h):
-                        for j in range(w):
-                            if(127 < block[i, j] or block[i, j] < -128):
-                                raise ValueError(f"Block value out of range! Value: {block[i, j]}")
\ No newline at end of file
+    def __verify_channel(self, channel_blocks):
+        if channel_blocks.size == 0:
+            return
+        low, high = channel_blocks.min(), channel_blocks.max()
+        if high > 127:
+            raise ValueError(f"Block value out of range! Value: {high}")
+        if low < -128:
+            raise ValueError(f"Block value out of range! Value: {low}")
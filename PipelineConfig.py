@@ -0,0 +1,89 @@
+from DiagnosticsSink import DiagnosticsSink
+from Instrumentation import Instrumentation, DISABLED
+
+# Use this class to configure one run of the encoder pipeline (see main.encode_image)
+# Two predefined profiles:
+# - "production": encode only --> no previews, no verification passes, no debug prints
+#                 (matplotlib is never imported then)
+# - "diagnostic": the original behavior --> preview plots of every stage in INTER_IMAGE_DIR,
+#                 subsampling round trip, IDCT verification and prints of the intermediate data
+class PipelineConfig:
+    PROFILES = ("production", "diagnostic")
+
+    # q_factor:        quality factor of the quantization tables
+    # subsampling:     (L, Ch, Cv) chroma subsampling, e.g. (4, 2, 0)
+    # dct_backend:     DCT engine, see DiscreteCosineTransformer.BACKENDS ("aan": fixed-point, quantization folded in)
+    # table_mode:      Huffman table mode, see HuffmanEncoder.TABLE_MODES
+    # restart_interval: MCUs per restart segment (0 = no restart markers)
+    # restart_min_pixels: restart markers only for images with at least this many pixels
+    #                  --> small images keep the plain layout (no DRI/RSTn, no pool), see restart_interval_for
+    # entropy_executor: pool for the restart segments if several entropy workers are used ("thread"/"process",
+    #                  see HuffmanEncoder.EXECUTORS) --> "process" sidesteps the GIL, but forks + pickles the scan;
+    #                  no many-core measurement shows it paying off yet (Benchmark.py --entropy-workers)
+    # save_previews:   save the show_blocks/save_subsample_plot previews + the subsampled image
+    # verify:          run the verification passes (IDCT, subsampling round trip)
+    # upsampling:      chroma upsampling filter of the subsampling round trip, see ChromaSubsampler.UPSAMPLING_FILTERS
+    # verbose:         print intermediate data (coefficients, symbols, Huffman tables, ...)
+    # preview_worker/preview_queue_size/preview_policy/preview_workers: background saving of the previews,
+    #                  see DiagnosticsSink
+    # instrument:      record time/memory/counts per pipeline stage, see Instrumentation
+    # trace_memory:    also trace the peak memory per stage (tracemalloc --> slows the pipeline down)
+    def __init__(self, q_factor=50, subsampling=(4, 2, 0), dct_backend="matrix", table_mode="optimized", restart_interval=64,
+                 restart_min_pixels=4_000_000, entropy_executor="thread",
+                 save_previews=False, verify=False, upsampling="nearest", verbose=False,
+                 preview_worker="process", preview_queue_size=32, preview_policy="block", preview_workers=2,
+                 instrument=False, trace_memory=True):
+        self.q_factor = q_factor
+        self.subsampling = subsampling
+        self.dct_backend = dct_backend
+        self.table_mode = table_mode
+        self.restart_interval = restart_interval
+        self.restart_min_pixels = restart_min_pixels
+        self.entropy_executor = entropy_executor
+        self.save_previews = save_previews
+        self.verify = verify
+        self.upsampling = upsampling
+        self.verbose = verbose
+        self.preview_worker = preview_worker
+        self.preview_queue_size = preview_queue_size
+        self.preview_policy = preview_policy
+        self.preview_workers = preview_workers
+        self.instrument = instrument
+        self.trace_memory = trace_memory
+
+    # Predefined profile by name, keyword arguments override single settings
+    @classmethod
+    def profile(cls, name, **overrides):
+        if name == "production":
+            settings = {}
+        elif name == "diagnostic":
+            settings = {"save_previews": True, "verify": True, "verbose": True}
+        else:
+            raise ValueError(f"Unknown pipeline profile '{name}', expected one of {cls.PROFILES}")
+        settings.update(overrides)
+        return cls(**settings)
+
+    # Background sink for the previews (only needed if save_previews is set)
+    def diagnostics_sink(self, worker=None):
+        return DiagnosticsSink(worker or self.preview_worker, self.preview_queue_size, self.preview_policy,
+                               self.preview_workers)
+
+    # Per-stage instrumentation (the shared disabled instance if instrument is not set)
+    def instrumentation(self):
+        if not self.instrument:
+            return DISABLED
+        return Instrumentation(trace_memory=self.trace_memory)
+
+    # Restart interval actually used for a width x height image (0 = no restart markers)
+    def restart_interval_for(self, width, height):
+        if width * height < self.restart_min_pixels:
+            return 0
+        return self.restart_interval
+
+    # Any of the diagnostic stages enabled?
+    @property
+    def diagnostics(self):
+        return self.save_previews or self.verify or self.verbose
+
+    def __repr__(self):
+        return f"PipelineConfig({', '.join(f'{key}={value!r}' for key, value in vars(self).items())})"
@@ -1,5 +1,9 @@
+from functools import lru_cache
+
 import numpy as np
 
+from DiscreteCosineTransformer import AAN_SCALE, AAN_OUTPUT_SCALE
+
 # Source (quantization tables): https://www.sciencedirect.com/topics/engineering/quantization-table
 # Source (quality factor): https://stackoverflow.com/questions/29215879/how-can-i-generalize-the-quantization-matrix-in-jpeg-compression
 
@@ -25,6 +29,42 @@ C = np.array([
     [99, 99, 99, 99, 99, 99, 99, 99]
 ], dtype=np.int32)
 
+# Scaled tables depend on the quality factor only --> compute them once per q_factor and
+# share them across all Quantizer instances (small LRU cache, arrays are read-only!)
+@lru_cache(maxsize=16)
+def _cached_tables(q_factor):
+    scaled = {"L": _scale_table(L, q_factor), "C": _scale_table(C, q_factor)}
+    aan_factors = np.outer(AAN_SCALE, AAN_SCALE) * AAN_OUTPUT_SCALE
+    tables = {
+        "L": scaled["L"],
+        "C": scaled["C"],
+        # Reciprocals --> quantization becomes a multiplication instead of a division
+        "L_recip": 1.0 / scaled["L"],
+        "C_recip": 1.0 / scaled["C"],
+        # Reciprocals for the AAN backend (see DiscreteCosineTransformer.aan_channel):
+        # the AAN output scale factors are folded into the divisors --> float32 tables
+        "L_aan": (1.0 / (scaled["L"] * aan_factors)).astype(np.float32),
+        "C_aan": (1.0 / (scaled["C"] * aan_factors)).astype(np.float32),
+    }
+    for table in tables.values():
+        table.setflags(write=False)
+    return tables
+
+# Calculate scaled tables according to quality factor
+def _scale_table(table, q_factor):
+    # 1 <= q_factor < 50 = range(102, 5000) [for scale]
+    if(q_factor < 50):
+        scale = 5000 / q_factor
+    else:
+        # 50 <= q_factor <= 100 = range(0, 100) [for scale]
+        scale = 200 - 2 * q_factor
+
+    # range(0.5, 50.5) --> floor  = range (0, 50) [ignoring table]
+    scaled_table = np.floor((table * scale + 50) / 100)
+    # avoid zeros --> for later division!
+    # cap at 255 --> baseline JPEG stores 8-bit tables (DQT)
+    return np.clip(scaled_table, 1, 255)
+
 class Quantizer:
     def __init__(self, q_factor):
         # This factor can range from 1 to 100
@@ -32,40 +72,50 @@ class Quantizer:
             raise ValueError("Quantizer factor must be between 1 and 100")
         self.q_factor = q_factor
 
+    # Scaled tables (+ reciprocals) for this quality factor, fetched from the shared cache
+    @property
+    def tables(self):
+        return _cached_tables(self.q_factor)
+
     # Quantize all blocks using scaling of quantization tables + q_factor
-    def quantize_blocks(self, Y_blocks, Cb_blocks, Cr_blocks):
-
-        luma_h, luma_w, _, _ = Y_blocks.shape
-
-        for i in range(luma_h):
-            for j in range(luma_w):
-                Y_blocks[i, j] = self.__quantize_block(Y_blocks[i, j], L)
-
-        chroma_h, chroma_w, _, _ = Cb_blocks.shape
-        for i in range(chroma_h):
-            for j in range(chroma_w):
-                Cb_blocks[i, j] = self.__quantize_block(Cb_blocks[i, j], C)
-                Cr_blocks[i, j] = self.__quantize_block(Cr_blocks[i, j], C)
-        #print("Q_V: ", Y_blocks)
-        #print("Q_Cb: ", Cb_blocks)
-        #print("Q_Cr: ", Cr_blocks)
-        return Y_blocks, Cb_blocks, Cr_blocks
-
-    # Scale the tables according to the quality factor --> return integer array
-    def __quantize_block(self, block, table):
-        scaled_table = self.__scale_table(table)
-        return np.round(block/scaled_table).astype(dtype=np.int32)
-
-    # Calculate scaled tables according to quality factor
-    def __scale_table(self, table):
-        # 1 <= q_factor < 50 = range(102, 5000) [for scale]
-        if(self.q_factor < 50):
-            scale = 5000 / self.q_factor
-        else:
-            # 50 <= q_factor <= 100 = range(0, 100) [for scale]
-            scale = 200 - 2 * self.q_factor
-
-        # range(0.5, 50.5) --> floor  = range (0, 50) [ignoring table]
-        scaled_table = np.floor((table * scale + 50) / 100)
-        scaled_table[scaled_table == 0] = 1  # avoid zeros --> for later division!
-        return scaled_table
+    # backend: DCT backend that produced the coefficients --> "aan" needs the AAN tables
+    def quantize_blocks(self, Y_blocks, Cb_blocks, Cr_blocks, backend="matrix"):
+        if backend == "aan":
+            return self.quantize_aan_blocks(Y_blocks, Cb_blocks, Cr_blocks)
+        tables = self.tables
+        return (self.quantize_channel(Y_blocks, tables["L_recip"]),
+                self.quantize_channel(Cb_blocks, tables["C_recip"]),
+                self.quantize_channel(Cr_blocks, tables["C_recip"]))
+
+    # Quantize a whole (nv, nh, 8, 8) channel at once --> the 8x8 reciprocal
+    # table is broadcast over all blocks, result is an int32 array
+    def quantize_channel(self, channel_blocks, reciprocal):
+        return np.round(channel_blocks * reciprocal).astype(np.int32)
+
+    # Return the luma and chroma tables scaled according to the quality factor
+    def scaled_tables(self):
+        return self.tables["L"], self.tables["C"]
+
+    # Return the reciprocals of the scaled luma and chroma tables (for the coefficients of <backend>)
+    def reciprocal_tables(self, backend="matrix"):
+        if backend == "aan":
+            return self.aan_reciprocal_tables()
+        return self.tables["L_recip"], self.tables["C_recip"]
+
+    # Reciprocal tables for the AAN backend, see _cached_tables
+    def aan_reciprocal_tables(self):
+        return self.tables["L_aan"], self.tables["C_aan"]
+
+    # Quantize the scaled int32 coefficients of AAN_DCT_2D --> one float32 multiply per coefficient
+    def quantize_aan_blocks(self, Y_blocks, Cb_blocks, Cr_blocks):
+        L_recip, C_recip = self.aan_reciprocal_tables()
+        return (self.quantize_aan_channel(Y_blocks, L_recip),
+                self.quantize_aan_channel(Cb_blocks, C_recip),
+                self.quantize_aan_channel(Cr_blocks, C_recip))
+
+    # float32 product, rounded half to even (like quantize_channel) --> int32
+    def quantize_aan_channel(self, channel_blocks, reciprocal):
+        scaled = channel_blocks.astype(np.float32)
+        scaled *= reciprocal
+        np.rint(scaled, out=scaled)
+        return scaled.astype(np.int32)
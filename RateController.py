@@ -0,0 +1,79 @@
+import io
+
+from PIL import Image
+
+from ChromaSubsampler import ChromaSubsampler
+from ColorSpaceConverter import ColorSpaceConverter
+from BlockSplitter import BlockSplitter
+from LevelShifter import LevelShifter
+from DiscreteCosineTransformer import DCT_2D
+from ScanAssembler import ScanAssembler
+from FrameEncoder import encode_frame
+from PipelineConfig import PipelineConfig
+
+# Use this class to encode the same image at several quality factors:
+# everything up to the DCT does not depend on the quality factor --> color conversion + subsampling,
+# blocking, level shift and DCT_2D run once, the (MCU padded) coefficients are cached
+# --> per quality factor only quantization and entropy coding run again
+# - sweep:    JPEGs for a list of quality factors
+# - fit_size: highest quality factor whose JPEG fits a byte budget (binary search)
+# Expects a PipelineConfig for subsampling, Huffman table mode and restart interval
+# (config.q_factor is ignored, the quality factor is passed to encode)
+# entropy_workers/entropy_pool: restart segment encoding, see main.encode_image
+class RateController:
+    def __init__(self, image: Image.Image, config=None, entropy_workers=1, entropy_pool=None):
+        self.config = config or PipelineConfig.profile("production")
+        self.entropy_workers = entropy_workers
+        self.entropy_pool = entropy_pool
+        self.width, self.height = image.size
+        self.restart_interval = self.config.restart_interval_for(self.width, self.height)
+
+        Y, Cb, Cr = ColorSpaceConverter('RGB', 'YCbCr').convert_arrays(image, self.config.subsampling)
+        subsampler = ChromaSubsampler(None, *self.config.subsampling)
+        blocks = BlockSplitter(8).split_all_channels(Y, Cb, Cr)
+        blocks = LevelShifter(128).shift(*blocks)
+        coefficients = DCT_2D(*blocks, backend=self.config.dct_backend)
+
+        self.h_factor, self.v_factor = subsampler.luma_sampling_factors()
+        self.assembler = ScanAssembler(self.h_factor, self.v_factor)
+        # Padding whole blocks commutes with quantization --> pad the coefficients once
+        self.coefficients = self.assembler.pad_to_mcus(*coefficients, self.width, self.height)
+        for channel in self.coefficients:
+            channel.setflags(write=False)
+        self.Y_order = self.assembler.luma_order(self.width, self.height)
+        # Encoded JPEGs per quality factor (fit_size probes the same factors repeatedly)
+        self.__encoded = {}
+
+    # JPEG bytes at the given quality factor (1 .. 100)
+    def encode(self, q_factor):
+        if q_factor not in self.__encoded:
+            self.__encoded[q_factor] = self.__encode(q_factor)
+        return self.__encoded[q_factor]
+
+    # {q_factor: JPEG bytes} for all given quality factors
+    def sweep(self, q_factors):
+        return {q_factor: self.encode(q_factor) for q_factor in q_factors}
+
+    # Highest quality factor in [min_q, max_q] whose JPEG has at most max_bytes bytes
+    # --> returns (q_factor, JPEG bytes); if even min_q is too large, (min_q, its JPEG) is returned
+    # The file size grows with the quality factor --> binary search, about log2(100) ~ 7 encodes
+    def fit_size(self, max_bytes, min_q=1, max_q=100):
+        low, high = min_q, max_q
+        best = None
+        while low <= high:
+            q_factor = (low + high) // 2
+            if len(self.encode(q_factor)) <= max_bytes:
+                best = q_factor
+                low = q_factor + 1
+            else:
+                high = q_factor - 1
+        if best is None:
+            best = min_q
+        return best, self.encode(best)
+
+    # Quantization + entropy coding (same steps as main.encode_image, see FrameEncoder.encode_frame)
+    def __encode(self, q_factor):
+        output = io.BytesIO()
+        encode_frame(self.coefficients, q_factor, self.assembler, self.Y_order, self.width, self.height, output,
+                     self.config, self.entropy_workers, self.entropy_pool)
+        return output.getvalue()
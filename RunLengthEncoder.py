@@ -1,3 +1,11 @@
+import numpy as np
+
+from SymbolEncoder import symbol_stream
+
+# Special AC symbols (symbol byte = RUN << 4 | SIZE)
+EOB = 0x00  # End of Block --> all remaining coefficients are zero
+ZRL = 0xF0  # Zero Run Length --> 16 consecutive zeros
+
 class RunLengthEncoder:
 
     # Perform Run-Length Encoding for JPEG AC coefficients.
@@ -9,6 +17,83 @@ class RunLengthEncoder:
         Cr_rle = self.__rl_encode_channel(Cr_diff)
         return Y_rle, Cb_rle, Cr_rle
 
+    # Vectorized variant of rl_encode: works on whole (num_blocks, 64) zigzag arrays
+    # and returns one symbol stream per channel instead of per-block dicts
+    def rl_encode_arrays(self, Y_diff, Cb_diff, Cr_diff):
+        return (self.rl_encode_array(Y_diff, 0),
+                self.rl_encode_array(Cb_diff, 1),
+                self.rl_encode_array(Cr_diff, 2))
+
+    # Encode all blocks of one channel at once with numpy
+    # --> returns a symbol stream (structured array, see SymbolEncoder.SYMBOL_DTYPE),
+    #     component: channel index stored with every symbol (0 = Y, 1 = Cb, 2 = Cr)
+    # Unlike __rl_encode_block, ZRLs are only emitted in front of a nonzero coefficient
+    # --> trailing zeros are always covered by a single EOB
+    def rl_encode_array(self, channel_diff, component=0):
+        channel_diff = np.asarray(channel_diff).reshape(-1, 64)
+        num_blocks = len(channel_diff)
+        dc = channel_diff[:, 0]
+        ac = channel_diff[:, 1:]
+
+        # Nonzero AC coefficients (sorted by block, then by position inside the block)
+        block_index, position = np.nonzero(ac)
+        values = ac[block_index, position]
+
+        # Zero run in front of each nonzero coefficient --> distance to the previous nonzero
+        # coefficient of the same block (or to the start of the AC coefficients)
+        first_in_block = np.ones(len(position), dtype=bool)
+        first_in_block[1:] = block_index[1:] != block_index[:-1]
+        previous = np.empty_like(position)
+        previous[1:] = position[:-1]
+        previous[first_in_block] = -1
+        run = position - previous - 1
+        # Every 16 zeros of a run become a ZRL symbol --> remaining run fits into 4 bits
+        zrl_count = run >> 4
+        run &= 15
+
+        # Symbols per nonzero coefficient: its ZRLs + the coefficient itself
+        ac_tokens = zrl_count + 1
+        ac_tokens_per_block = np.bincount(block_index, weights=ac_tokens, minlength=num_blocks).astype(np.int64)
+
+        # EOB if the last coefficient (position 62 of the AC part) is zero
+        last_in_block = np.ones(len(position), dtype=bool)
+        last_in_block[:-1] = block_index[1:] != block_index[:-1]
+        last_position = np.full(num_blocks, -1, dtype=np.int64)
+        last_position[block_index[last_in_block]] = position[last_in_block]
+        has_eob = last_position < ac.shape[1] - 1
+
+        # Symbols per block: DC + AC symbols + optional EOB
+        offsets = np.zeros(num_blocks + 1, dtype=np.int64)
+        np.cumsum(1 + ac_tokens_per_block + has_eob, out=offsets[1:])
+
+        # Everything not explicitly set below is a ZRL (no amplitude bits)
+        stream = symbol_stream(offsets[-1])
+        stream["symbol"] = ZRL
+        stream["component"] = component
+        stream["block"] = np.repeat(np.arange(num_blocks, dtype=np.uint32), np.diff(offsets))
+        # Field views --> written in place
+        symbols, bits, lengths = stream["symbol"], stream["bits"], stream["length"]
+
+        # DC symbols at the start of each block
+        dc_size = self.__magnitude_sizes(dc)
+        symbols[offsets[:-1]] = dc_size
+        bits[offsets[:-1]] = self.__magnitude_bits_array(dc, dc_size)
+        lengths[offsets[:-1]] = dc_size
+
+        # AC symbols: block start + all AC symbols of this block up to (and including) this one
+        tokens_before_block = np.zeros(num_blocks, dtype=np.int64)
+        np.cumsum(ac_tokens_per_block[:-1], out=tokens_before_block[1:])
+        ac_positions = offsets[block_index] + np.cumsum(ac_tokens) - tokens_before_block[block_index]
+        ac_size = self.__magnitude_sizes(values)
+        symbols[ac_positions] = (run << 4) | ac_size
+        bits[ac_positions] = self.__magnitude_bits_array(values, ac_size)
+        lengths[ac_positions] = ac_size
+
+        # EOB symbols at the end of each block that needs one
+        symbols[offsets[1:][has_eob] - 1] = EOB
+
+        return stream
+
     def __rl_encode_channel(self, channel_scan):
         # Encode all blocks in a single channel
         encoded_blocks = []
@@ -22,7 +107,7 @@ class RunLengthEncoder:
 
         # DC size + bits
         dc_size = self.__magnitude_size(dc_val)      # How many bits needed to represent DC
-        dc_bits = self.__magnitude_bits(dc_val, dc_size)  # Actual bitstring for DC
+        dc_bits = self.__magnitude_bits(dc_val, dc_size)  # Actual bits for DC
 
         # AC coefficients follow the DC
         ac = block_scan[1:]
@@ -37,7 +122,7 @@ class RunLengthEncoder:
                 zero_run += 1
                 # JPEG: if 16 consecutive zeros, use ZRL (Zero Run Length)
                 if zero_run == 16:
-                    rle.append(((15, 0), ""))  # ZRL symbol
+                    rle.append(((15, 0), 0))  # ZRL symbol
                     zero_run = 0
             else:
                 size = self.__magnitude_size(coeff)         # Number of bits to represent AC coefficient
@@ -47,7 +132,7 @@ class RunLengthEncoder:
 
         # End of Block (EOB) if remaining coefficients are zero
         if zero_run > 0:
-            rle.append(((0, 0), ""))  # EOB symbol
+            rle.append(((0, 0), 0))  # EOB symbol
 
         # Return dictionary with DC and RLE AC values
         return {
@@ -62,14 +147,30 @@ class RunLengthEncoder:
         return abs(value).bit_length()  # abs to handle negative numbers
 
     def __magnitude_bits(self, value, size):
-        # Convert a value into its bitstring representation for JPEG
+        # Convert a value into its JPEG amplitude bits --> stored as integer,
+        # the number of bits is <size>
         if size == 0:
-            return ""
+            return 0
 
-        # Convert absolute value to binary string
-        # --> pad to <size> bits with leading 0s!
-        bits = format(abs(value), f"0{size}b")
         if value < 0:
             # JPEG negative representation: invert bits of magnitude
-            bits = ''.join('1' if b=='0' else '0' for b in bits)
-        return bits
+            # --> same as value + 2^size - 1
+            return value + (1 << size) - 1
+        return value
+
+    def __magnitude_sizes(self, values):
+        # Vectorized __magnitude_size: bit length of |value| via binary search with shifts
+        magnitude = np.abs(values).astype(np.uint32)
+        sizes = np.zeros(magnitude.shape, dtype=np.uint8)
+        for shift in (8, 4, 2, 1):
+            larger = magnitude >= (1 << shift)
+            sizes += larger.astype(np.uint8) * shift
+            magnitude = np.where(larger, magnitude >> shift, magnitude)
+        # magnitude is now 0 or 1 --> the last bit
+        return sizes + magnitude.astype(np.uint8)
+
+    def __magnitude_bits_array(self, values, sizes):
+        # Vectorized __magnitude_bits: negative values are stored as value + 2^size - 1,
+        # which equals inverting the bits of the magnitude
+        values = values.astype(np.int32)
+        return np.where(values < 0, values + (1 << sizes.astype(np.int32)) - 1, values).astype(np.uint16)
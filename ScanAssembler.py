@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+
+from BlockSplitter import BlockSplitter
+from SymbolEncoder import block_offsets
+
+# Use this class to assemble a single interleaved scan (all three components) from the
+# separately encoded channels --> blocks are written MCU by MCU, e.g. for 4:2:0:
+# Y0 Y1 Y2 Y3 Cb Cr | Y0 Y1 Y2 Y3 Cb Cr | ...
+class ScanAssembler:
+    # Expects the luma sampling factors (see ChromaSubsampler.luma_sampling_factors)
+    def __init__(self, h_factor, v_factor):
+        self.h_factor = h_factor
+        self.v_factor = v_factor
+
+    # Blocks per MCU in the interleaved scan: all luma blocks + one Cb + one Cr block
+    @property
+    def blocks_per_mcu(self):
+        return self.h_factor * self.v_factor + 2
+
+    # Number of MCUs (vertical, horizontal) of a width x height image
+    def mcu_grid(self, width, height):
+        return math.ceil(height / (8 * self.v_factor)), math.ceil(width / (8 * self.h_factor))
+
+    # Coding order of the luma blocks (see DifferentialEncoder.differential_encode)
+    def luma_order(self, width, height):
+        mcus_v, mcus_h = self.mcu_grid(width, height)
+        return BlockSplitter(8).mcu_order(mcus_v * self.v_factor, mcus_h * self.h_factor,
+                                          self.h_factor, self.v_factor)
+
+    # An interleaved scan always covers whole MCUs --> pad the (nv, nh, 8, 8) block grids
+    # by repeating the last block row/column (the decoder discards these extra blocks)
+    def pad_to_mcus(self, Y_blocks, Cb_blocks, Cr_blocks, width, height):
+        mcus_v, mcus_h = self.mcu_grid(width, height)
+        return (self.__pad_grid(Y_blocks, mcus_v * self.v_factor, mcus_h * self.h_factor),
+                self.__pad_grid(Cb_blocks, mcus_v, mcus_h),
+                self.__pad_grid(Cr_blocks, mcus_v, mcus_h))
+
+    # Interleave the symbol streams of the three channels (see RunLengthEncoder.rl_encode_array)
+    # into MCU order --> one combined symbol stream, blocks are renumbered in scan order and
+    # "component" holds the channel index (0 = Y, 1 = Cb, 2 = Cr) of every symbol
+    # Y_order: coding order of the luma blocks (see luma_order)
+    def interleave(self, Y_rle, Cb_rle, Cr_rle, Y_order):
+        channels = (Y_rle, Cb_rle, Cr_rle)
+        channel_offsets = [block_offsets(channel) for channel in channels]
+        num_mcus = len(channel_offsets[1]) - 1
+        luma_per_mcu = self.h_factor * self.v_factor
+        if len(Y_order) != num_mcus * luma_per_mcu or len(channel_offsets[2]) - 1 != num_mcus:
+            raise ValueError("Block counts do not match the MCU grid --> pad the channels first (pad_to_mcus)")
+
+        # Global block ids: all Y blocks first, then Cb, then Cr (same as the concatenated arrays)
+        num_luma = len(Y_order)
+        block_ids = np.empty((num_mcus, luma_per_mcu + 2), dtype=np.int64)
+        block_ids[:, :luma_per_mcu] = np.asarray(Y_order).reshape(num_mcus, luma_per_mcu)
+        block_ids[:, luma_per_mcu] = num_luma + np.arange(num_mcus)
+        block_ids[:, luma_per_mcu + 1] = num_luma + num_mcus + np.arange(num_mcus)
+        block_ids = block_ids.ravel()
+
+        # Start/size of every block inside the concatenated arrays
+        symbol_base = np.cumsum([0] + [len(channel) for channel in channels])
+        block_starts = np.concatenate([offsets[:-1] + base for offsets, base in zip(channel_offsets, symbol_base)])
+        block_sizes = np.concatenate([np.diff(offsets) for offsets in channel_offsets])
+
+        # Gather all symbols block by block in MCU order
+        starts = block_starts[block_ids]
+        sizes = block_sizes[block_ids]
+        offsets = np.zeros(len(block_ids) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], sizes) + np.arange(offsets[-1])
+
+        scan = np.concatenate(channels)[gather]
+        components = np.tile(np.array([0] * luma_per_mcu + [1, 2], dtype=np.uint8), num_mcus)
+        scan["component"] = np.repeat(components, sizes)
+        scan["block"] = np.repeat(np.arange(len(block_ids), dtype=np.uint32), sizes)
+        return scan
+
+    def __pad_grid(self, blocks, num_vertical, num_horizontal):
+        pad_v = num_vertical - blocks.shape[0]
+        pad_h = num_horizontal - blocks.shape[1]
+        if pad_v < 0 or pad_h < 0:
+            raise ValueError(f"Block grid {blocks.shape[:2]} is larger than the MCU grid {(num_vertical, num_horizontal)}")
+        if pad_v == 0 and pad_h == 0:
+            return blocks
+        # An empty grid has no edge to repeat --> zero blocks
+        mode = 'edge' if blocks.size else 'constant'
+        return np.pad(blocks, ((0, pad_v), (0, pad_h), (0, 0), (0, 0)), mode=mode)
@@ -0,0 +1,113 @@
+import numpy as np
+from PIL import Image
+
+from ChromaSubsampler import ChromaSubsampler
+from ColorSpaceConverter import ColorSpaceConverter
+from BlockSplitter import BlockSplitter
+from LevelShifter import LevelShifter
+from DiscreteCosineTransformer import dct_channel, aan_channel
+from Quantizer import Quantizer
+from ZigZagScanner import ZigZagScanner
+from DifferentialEncoder import DifferentialEncoder
+from RunLengthEncoder import RunLengthEncoder
+from HuffmanEncoder import HuffmanEncoder
+from ScanAssembler import ScanAssembler
+from FrameBuilder import FrameBuilder, RST0
+
+# Use this class to encode very large images with bounded memory:
+# the image is read in strips of one MCU row (16 rows for 4:2:0, 8 rows otherwise) and every strip
+# goes through the whole pipeline (color conversion + subsampling, DCT, quantization, entropy coding) on its own
+# --> the encoded bytes of a strip are written to the output right away,
+#     the working memory only depends on the image width (NOT on its height)
+# How the strips stay independent:
+# - Huffman tables: the Annex K standard tables (optimized tables would need a pass over all strips first)
+# - DC prediction: the restart interval is one MCU row --> predictors restart with every strip
+#   and every strip is a byte-aligned restart segment (RST0 .. RST7 in between)
+# Note: PIL still decodes the whole source image (uint8) --> only the encoder's own buffers are bounded
+class StripEncoder:
+    # dct_backend: see DiscreteCosineTransformer.BACKENDS ("aan" --> DCT and quantization in one pass)
+    def __init__(self, q_factor=50, L=4, Ch=2, Cv=0, dct_backend="matrix"):
+        self.q_factor = q_factor
+        self.dct_backend = dct_backend
+        self.L, self.Ch, self.Cv = L, Ch, Cv
+        self.quantizer = Quantizer(q_factor)
+        # Checks the subsampling mode right away
+        self.h_factor, self.v_factor = ChromaSubsampler(None, L, Ch, Cv).luma_sampling_factors()
+        self.huffman_encoder = HuffmanEncoder("standard")
+        self.Y_tables = self.huffman_encoder.build_tables(None, "luma")
+        self.C_tables = self.huffman_encoder.build_tables(None, "chroma")
+
+    # Encode the image to output (file path or writable binary stream, see FrameBuilder)
+    # --> returns the number of bytes written
+    def encode(self, image: Image.Image, output):
+        width, height = image.size
+        h_factor, v_factor = self.h_factor, self.v_factor
+        assembler = ScanAssembler(h_factor, v_factor)
+        mcus_v, mcus_h = assembler.mcu_grid(width, height)
+        if mcus_h > 0xFFFF:
+            raise ValueError(f"Image too wide for one MCU row per restart interval: {width} pixels")
+
+        with FrameBuilder(output) as frame_builder:
+            frame_builder.write_headers(width, height, self.quantizer, self.huffman_encoder, self.Y_tables,
+                                        self.C_tables, h_factor, v_factor, mcus_h)
+            frame_builder.write_scan_data(self.encode_strips(image, assembler))
+            frame_builder.end_of_image()
+        return frame_builder.bytes_written
+
+    # Generator: entropy-coded bytes of one strip after the other (incl. the restart markers)
+    def encode_strips(self, image: Image.Image, assembler: ScanAssembler):
+        width, height = image.size
+        mcus_v, mcus_h = assembler.mcu_grid(width, height)
+        strip_height = 8 * assembler.v_factor
+        strip_width = 8 * assembler.h_factor * mcus_h
+        # Coding order of the luma blocks is the same for every strip
+        Y_order = assembler.luma_order(strip_width, strip_height)
+
+        converter = ColorSpaceConverter('RGB', 'YCbCr')
+        splitter = BlockSplitter(8)
+        shifter = LevelShifter(128)
+        scanner = ZigZagScanner()
+        diff_encoder = DifferentialEncoder()
+        rl_encoder = RunLengthEncoder()
+        L_recip, C_recip = self.quantizer.reciprocal_tables(self.dct_backend)
+        scan_tables = [self.Y_tables, self.C_tables, self.C_tables]
+
+        # Color conversion and level-shift buffers are allocated once and reused for every strip
+        planes = [np.empty(shape, dtype=np.uint8)
+                  for shape in converter.plane_shapes(strip_width, strip_height, (self.L, self.Ch, self.Cv))]
+        buffers = None
+        for strip in range(mcus_v):
+            top = strip * strip_height
+            rgb = self.__pad_strip(image.crop((0, top, width, min(top + strip_height, height))),
+                                   strip_height, strip_width)
+            # Color conversion + chroma subsampling in one pass
+            Y, Cb, Cr = converter.convert_arrays(rgb, (self.L, self.Ch, self.Cv), out=planes)
+
+            blocks = splitter.split_all_channels(Y, Cb, Cr)
+            if buffers is None:
+                buffers = [np.empty(channel.shape, dtype=np.int16) for channel in blocks]
+            blocks = [shifter.shift_channel(channel, out=buffer) for channel, buffer in zip(blocks, buffers)]
+            if self.dct_backend == "aan":
+                blocks = [aan_channel(channel, reciprocal) for channel, reciprocal in zip(blocks, (L_recip, C_recip, C_recip))]
+            else:
+                blocks = [self.quantizer.quantize_channel(dct_channel(channel, self.dct_backend), reciprocal)
+                          for channel, reciprocal in zip(blocks, (L_recip, C_recip, C_recip))]
+
+            Y_scan, Cb_scan, Cr_scan = scanner.zigzag_all_blocks(*blocks)
+            # Each strip is one restart interval --> predictors start at 0 again
+            Y_diff, Cb_diff, Cr_diff = diff_encoder.differential_encode(Y_scan, Cb_scan, Cr_scan, Y_order)
+            Y_rle, Cb_rle, Cr_rle = rl_encoder.rl_encode_arrays(Y_diff, Cb_diff, Cr_diff)
+            scan = assembler.interleave(Y_rle, Cb_rle, Cr_rle, Y_order)
+
+            if strip > 0:
+                yield bytes((0xFF, RST0 + (strip - 1) % 8))
+            yield self.huffman_encoder.encode_bitstream(scan, scan_tables)
+
+    # Strip --> RGB array covering whole MCUs (repeat the last row/column, as BlockSplitter does)
+    def __pad_strip(self, strip_image, strip_height, strip_width):
+        rgb = np.asarray(strip_image if strip_image.mode == "RGB" else strip_image.convert("RGB"))
+        pad_h = strip_height - rgb.shape[0]
+        pad_w = strip_width - rgb.shape[1]
+        if pad_h == 0 and pad_w == 0:
+            return rgb
+        return np.pad(rgb, ((0, pad_h), (0, pad_w), (0, 0)), mode='edge')
@@ -1,48 +1,92 @@
+import numpy as np
+
+# Symbol stream: ONE structured array with a row per JPEG symbol, shared by RunLengthEncoder
+# (writes it), SymbolEncoder, ScanAssembler and HuffmanEncoder (read it)
+# - symbol:    symbol byte --> DC: SIZE, AC: RUN << 4 | SIZE (EOB = 0x00, ZRL = 0xF0)
+# - bits:      amplitude bits (negative values in JPEG's ones' complement form)
+# - length:    number of amplitude bits (= SIZE, 0 for EOB/ZRL)
+# - component: channel of the symbol's block (0 = Y, 1 = Cb, 2 = Cr)
+# - block:     index of the block the symbol belongs to, ascending --> the first symbol of a block is its DC
+# 9 bytes per symbol, no Python objects per block or symbol
+SYMBOL_DTYPE = np.dtype([
+    ("symbol", np.uint8),
+    ("bits", np.uint16),
+    ("length", np.uint8),
+    ("component", np.uint8),
+    ("block", np.uint32),
+])
+
+# Empty (zeroed) symbol stream with room for <count> symbols
+def symbol_stream(count):
+    return np.zeros(count, dtype=SYMBOL_DTYPE)
+
+# Number of blocks in a stream (or a slice of one)
+def block_count(stream):
+    if len(stream) == 0:
+        return 0
+    return int(stream["block"][-1]) - int(stream["block"][0]) + 1
+
+# Symbol range of every block: block b (counted from the first block of the stream) owns the
+# symbols [offsets[b], offsets[b + 1]) --> every block has at least its DC symbol
+def block_offsets(stream):
+    if len(stream) == 0:
+        return np.zeros(1, dtype=np.int64)
+    first = stream["block"][0]
+    return np.searchsorted(stream["block"], np.arange(first, first + block_count(stream) + 1))
+
+# True for the DC symbol (the first symbol) of every block
+def dc_mask(stream):
+    is_dc = np.ones(len(stream), dtype=bool)
+    block = stream["block"]
+    np.not_equal(block[1:], block[:-1], out=is_dc[1:])
+    return is_dc
+
 class SymbolEncoder:
 
     # IMPORTANT:
     # At this stage, coefficients are ALREADY encoded into:
-    # - DC: (SIZE, bitstring)
-    # - AC: [((RUN, SIZE), bitstring), ..., (0,0)=EOB, (15,0)=ZRL]
+    # - DC: (SIZE, amplitude bits as integer)
+    # - AC: [((RUN, SIZE), amplitude bits as integer), ..., (0,0)=EOB, (15,0)=ZRL]
     #
     # Therefore: NO magnitude calculation is done here anymore!
+    # Symbol streams (see RunLengthEncoder.rl_encode_array) are passed on as they are, only the
+    # per-block dicts of RunLengthEncoder.rl_encode are packed into a symbol stream
 
     def encode(self, Y_rle, Cb_rle, Cr_rle):
         return (
-            self.__encode_channel(Y_rle),
-            self.__encode_channel(Cb_rle),
-            self.__encode_channel(Cr_rle)
+            self.__encode_channel(Y_rle, 0),
+            self.__encode_channel(Cb_rle, 1),
+            self.__encode_channel(Cr_rle, 2)
         )
 
-    def __encode_channel(self, channel_blocks):
-        # Encode all blocks of one channel first
-        encoded_blocks = []
+    def __encode_channel(self, channel_blocks, component):
+        # Symbol streams already are in final JPEG symbol form --> nothing to do
+        if isinstance(channel_blocks, np.ndarray):
+            return channel_blocks
+
+        # Count the symbols of all blocks first --> one allocation
+        sizes = [1 + len(block["AC"]) for block in channel_blocks]
+        stream = symbol_stream(sum(sizes))
+        stream["component"] = component
+        stream["block"] = np.repeat(np.arange(len(sizes), dtype=np.uint32), sizes)
+
+        symbols, bits, lengths = [], [], []
         for block in channel_blocks:
-            encoded_blocks.append(self.__encode_block(block))
-        return encoded_blocks
-
-    def __encode_block(self, block):
-        # Encode a single block
-        #
-        # DC:
-        #   - Already encoded as (SIZE, bits)
-        #
-        # AC:
-        #   - Already encoded as ((RUN, SIZE), bits)
-        #   - ZRL  = ((15, 0), "")
-        #   - EOB  = ((0, 0), "")
-
-        # DC coefficient (already encoded)
-        dc_size, dc_bits = block["DC"]
-
-        # AC coefficients (already encoded)
-        ac_encoded = []
-
-        for ac in block["AC"]:
-            # AC entries are already in final JPEG symbol form
-            ac_encoded.append(ac)
-
-        return {
-            "DC": (dc_size, dc_bits),
-            "AC": ac_encoded
-        }
+            # DC: already encoded as (SIZE, bits)
+            dc_size, dc_bits = block["DC"]
+            symbols.append(dc_size)
+            bits.append(dc_bits)
+            lengths.append(dc_size)
+
+            # AC: already encoded as ((RUN, SIZE), bits)
+            # - ZRL  = ((15, 0), 0)
+            # - EOB  = ((0, 0), 0)
+            for (run, size), ac_bits in block["AC"]:
+                symbols.append((run << 4) | size)
+                bits.append(ac_bits)
+                lengths.append(size)
+
+        stream["symbol"] = symbols
+        stream["bits"] = bits
+        stream["length"] = lengths
+        return stream
@@ -1,8 +1,16 @@
 import numpy as np
 
 class ZigZagScanner:
+    # Zigzag permutations per block size --> computed once, shared across all instances
+    __orders = {}
+
     # Perform the zigzag scan for all channels
-    def zigzag_all_blocks(self, Y_blocks, Cb_blocks, Cr_blocks):
+    # gather=True:  one fancy-indexing call per channel --> (num_blocks, N*N) int32 arrays
+    # gather=False: traverse every block separately --> lists of lists (original behaviour)
+    def zigzag_all_blocks(self, Y_blocks, Cb_blocks, Cr_blocks, gather=True):
+        if gather:
+            return [self.zigzag_channel(channel_blocks) for channel_blocks in (Y_blocks, Cb_blocks, Cr_blocks)]
+
         # Force block values to be integers
         Y_blocks = Y_blocks.astype(np.int32)
         Cb_blocks = Cb_blocks.astype(np.int32)
@@ -18,6 +26,26 @@ class ZigZagScanner:
             scans.append(channel_scan)
         return scans
 
+    # Gather mode: apply the precomputed zigzag permutation to all (nv, nh, N, N) blocks
+    # of a channel at once --> (nv * nh, N * N) array, blocks in row-major (raster) order
+    def zigzag_channel(self, channel_blocks, dtype=np.int32):
+        num_vertical, num_horizontal, block_height, block_width = channel_blocks.shape
+        if(block_height != block_width):
+            raise ValueError(f"Block size is not square! {(block_height, block_width)}")
+        flat_blocks = channel_blocks.reshape(num_vertical * num_horizontal, block_height * block_width)
+        return np.take(flat_blocks, self.zigzag_order(block_height), axis=1).astype(dtype, copy=False)
+
+    # Flat N*N zigzag permutation: entry k is the row-major index of the k-th scanned coefficient
+    # --> obtained by running the regular scan once over a block of indices
+    def zigzag_order(self, block_size):
+        order = ZigZagScanner.__orders.get(block_size)
+        if order is None:
+            indices = np.arange(block_size * block_size).reshape(block_size, block_size)
+            order = np.array(self.__zigzag_block(indices), dtype=np.intp)
+            order.setflags(write=False)
+            ZigZagScanner.__orders[block_size] = order
+        return order
+
     # Perform the zigzag scan: Go up, if the diagonal has an even index, and
     # go down, if it has an odd index --> keep direction changes in mind at all times!
     def __zigzag_block(self, block):
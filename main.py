@@ -1,4 +1,11 @@
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, wait
+import atexit
+import contextlib
+import itertools
+import multiprocessing.util
+import os
 import sys
+import time
 
 from PIL import Image
 from pathlib import Path
@@ -8,14 +15,15 @@ from ChromaSubsampler import ChromaSubsampler
 from ColorSpaceConverter import ColorSpaceConverter
 from BlockSplitter import BlockSplitter
 from LevelShifter import LevelShifter
-from DiscreteCosineTransformer import DCT_2D, IDCT_2D
-from Quantizer import Quantizer, L, C
-from ZigZagScanner import ZigZagScanner
-from DifferentialEncoder import DifferentialEncoder
-from RunLengthEncoder import RunLengthEncoder
-from SymbolEncoder import SymbolEncoder
-from HuffmanEncoder import HuffmanEncoder
-from Helper import show_blocks, save_subsample_plot, get_images, save_image
+from DiscreteCosineTransformer import DCT_2D, IDCT_2D, aan_descale
+from HuffmanEncoder import EXECUTORS
+from ScanAssembler import ScanAssembler
+from FrameEncoder import encode_frame
+from StripEncoder import StripEncoder
+from PipelineConfig import PipelineConfig
+from EncodeCache import EncodeCache
+from Instrumentation import DISABLED, write_jsonl, summary_table
+from Helper import show_blocks, save_subsample_plot, save_image, get_images
 
 # This is a basic JPEG encoder
 
@@ -23,126 +31,330 @@ SRC_IMAGE_DIR = Path('./pre_jpeg')
 INTER_IMAGE_DIR = Path('./intermediate')
 OUT_IMAGE_DIR = Path('./post_jpeg')
 
-###### GENERAL STEPS OF A JPEG ENCODER ######
-if __name__ == '__main__':
+# Pipeline profile: "production" (encode only) or "diagnostic" (previews, verification, debug prints)
+# --> quality, subsampling, Huffman table mode and restart interval are set in the profile, see PipelineConfig
+CONFIG = PipelineConfig.profile("production")
 
-    # Use this for debugging/viewing purposes
-    np.set_printoptions(threshold=sys.maxsize)
+# Restart segments are entropy coded independently by a pool of workers (threads by default,
+# see PipelineConfig.entropy_executor) --> only images with restart markers (see PipelineConfig.restart_min_pixels)
+ENTROPY_WORKERS = os.cpu_count() or 1
 
-    # Fetch all images
-    images = get_images(SRC_IMAGE_DIR)
+# Images with at least this many pixels are encoded strip by strip (bounded memory, standard
+# Huffman tables, no intermediate previews) --> see StripEncoder
+STRIP_ENCODING_MIN_PIXELS = 16_000_000
+
+# Per-stage measurements are appended here (JSON lines) if CONFIG.instrument is set
+STAGE_LOG = Path('./stage_timings.jsonl')
+
+# On-disk cache of finished JPEGs (None = no cache) and its size limit --> see EncodeCache
+ENCODE_CACHE_DIR = Path('./encode_cache')
+ENCODE_CACHE_BYTES = 512 * 1024 * 1024
+
+# Batch mode: number of worker processes, each encoding whole images (None = one per CPU, 1 = no pool)
+BATCH_WORKERS = None
 
-    for image in images:
-        w, h = image.size
-        # Color space conversion RGB --> YCbCr
+###### GENERAL STEPS OF A JPEG ENCODER ######
+# Encode a single (opened) image and save it to out_dir --> returns the result dict
+# config: PipelineConfig --> "production" skips all previews/verification passes/debug prints
+# entropy_workers: pool size for the restart segments (1 inside batch workers --> no oversubscription)
+# entropy_pool: long-lived executor for the restart segments (None --> a new config.entropy_executor pool
+#               per image), see HuffmanEncoder.encode_restart_stream
+# sink: DiagnosticsSink that renders/saves the previews in the background (None --> save them right away)
+# instruments: Instrumentation that records time/memory/counts per stage (see config.instrumentation)
+# --> the records of this image are returned in result["stages"]
+def encode_image(image, config=CONFIG, entropy_workers=ENTROPY_WORKERS, sink=None, instruments=DISABLED,
+                 out_dir=OUT_IMAGE_DIR, entropy_pool=None):
+    w, h = image.size
+    name = Path(image.filename).name
+    out_path = (Path(out_dir) / name).with_suffix(".jpg")
+    first_record = len(instruments.records)
+    if w * h >= STRIP_ENCODING_MIN_PIXELS:
+        with instruments.measure("StripEncoder", name) as stage:
+            num_bytes = StripEncoder(config.q_factor, *config.subsampling, config.dct_backend).encode(image, out_path)
+            stage.count(pixels=w * h, output_bits=num_bytes * 8)
+        print(f"Saved JPEG to '{out_path}' ({num_bytes} bytes, strip encoded)")
+        return {"source": image.filename, "output": str(out_path), "width": w, "height": h, "bytes": num_bytes,
+                "stages": instruments.records[first_record:]}
+
+    # Previews only get small copies of the data --> the full arrays are not kept alive by queued previews
+    def preview(function, *args):
+        args = [np.array(arg) if isinstance(arg, np.ndarray) else arg for arg in args]
+        if sink is None:
+            function(*args)
+        else:
+            sink.submit(function, *args)
+
+    # Color space conversion RGB --> YCbCr + chroma subsampling (4:2:0 by default) in one pass
+    # --> fixed-point NumPy path, full-resolution chroma planes are never built
+    with instruments.measure("ColorSpaceConverter", name) as stage:
         converter = ColorSpaceConverter('RGB', 'YCbCr')
-        converted = converter.convert(image)
-        # Check whether color space conversion worked
-        print(converted.mode)
+        Y, Cb, Cr = converter.convert_arrays(image, config.subsampling)
+        stage.count(pixels=w * h, samples=Y.size + Cb.size + Cr.size)
+    # Check whether color space conversion + subsampling worked
+    if config.verbose:
+        print(f"Y: {Y.shape}, Cb: {Cb.shape}, Cr: {Cr.shape}")
 
-        # Chroma subsampling (4:2:0)
-        subsampler = ChromaSubsampler(converted,4,2,0)
-        Y, Cb, Cr = subsampler.subsample()
-        #Y, Cb, Cr = subsampler.upsample(Y, Cb, Cr)
+    # Chroma subsampler --> only needed for the sampling factors and the verification (upsampling)
+    subsampler = ChromaSubsampler(None, *config.subsampling, upsampling=config.upsampling, verbose=config.verbose)
+    #Y, Cb, Cr = subsampler.upsample(Y, Cb, Cr)
 
-        # Test subsampling effect via upsampling
+    # Test subsampling effect via upsampling
+    if config.verify:
         Y_up, Cb_up, Cr_up = subsampler.upsample(Y, Cb, Cr)
         #print("Y :", Y_up.shape)
         #print("Cb:", Cb_up.shape)
         #print("Cr:", Cr_up.shape)
-        img = Image.merge(
-            "YCbCr",
-            (
-                Image.fromarray(Y_up),
-                Image.fromarray(Cb_up),
-                Image.fromarray(Cr_up),
-            ),
-        )
-        back_converter = ColorSpaceConverter('YCbCr', 'RGB')
-        img = back_converter.convert(img)
-        img.save(INTER_IMAGE_DIR / "subsampling" / f"subsampled_{Path(image.filename).name}")
-        save_subsample_plot(Y, Cb, Cr, Cb_up, Cr_up, INTER_IMAGE_DIR /  "subsampling" / f"sampled_{Path(image.filename).name}")
-
-
-        # Block preparation/splitting (8x8)
+        if config.save_previews:
+            img = Image.merge(
+                "YCbCr",
+                (
+                    Image.fromarray(Y_up),
+                    Image.fromarray(Cb_up),
+                    Image.fromarray(Cr_up),
+                ),
+            )
+            back_converter = ColorSpaceConverter('YCbCr', 'RGB')
+            img = back_converter.convert(img)
+            preview(save_image, img, INTER_IMAGE_DIR / "subsampling" / f"subsampled_{name}")
+            preview(save_subsample_plot, Y, Cb, Cr, Cb_up, Cr_up, INTER_IMAGE_DIR /  "subsampling" / f"sampled_{name}")
+
+
+    # Block preparation/splitting (8x8)
+    with instruments.measure("BlockSplitter", name) as stage:
         splitter = BlockSplitter(8)
         Y_blocks, Cb_blocks, Cr_blocks = splitter.split_all_channels(Y, Cb, Cr)
+        stage.count(blocks=(Y_blocks.size + Cb_blocks.size + Cr_blocks.size) // 64)
+    if config.verbose:
         print(Y_blocks.shape)
         print(Cb_blocks.shape)
         print(Cr_blocks.shape)
-        show_blocks(Y_blocks[:10, :10], INTER_IMAGE_DIR / "blocking" / f"Y_{Path(image.filename).name}", "Y Blocks", 0, 255)
-        show_blocks(Cb_blocks[:10, :10], INTER_IMAGE_DIR / "blocking" / f"Cb_{Path(image.filename).name}", "Cb Blocks", 0, 255)
-        show_blocks(Cr_blocks[:10, :10], INTER_IMAGE_DIR / "blocking" / f"Cr_{Path(image.filename).name}", "Cr Blocks", 0, 255)
+    if config.save_previews:
+        preview(show_blocks, Y_blocks[:10, :10], INTER_IMAGE_DIR / "blocking" / f"Y_{name}", "Y Blocks", 0, 255)
+        preview(show_blocks, Cb_blocks[:10, :10], INTER_IMAGE_DIR / "blocking" / f"Cb_{name}", "Cb Blocks", 0, 255)
+        preview(show_blocks, Cr_blocks[:10, :10], INTER_IMAGE_DIR / "blocking" / f"Cr_{name}", "Cr Blocks", 0, 255)
 
-        # Shift pixel value range [0, 255] → [-128, 127] (for DCT)
+    # Shift pixel value range [0, 255] → [-128, 127] (for DCT)
+    with instruments.measure("LevelShifter", name) as stage:
         shifter = LevelShifter(128)
         Y_blocks, Cb_blocks, Cr_blocks = shifter.shift(Y_blocks, Cb_blocks, Cr_blocks)
-        show_blocks(Y_blocks[:10, :10], INTER_IMAGE_DIR / "shifting" / f"Y_{Path(image.filename).name}", "Y Blocks Shifted", -128, 127)
-        show_blocks(Cb_blocks[:10, :10], INTER_IMAGE_DIR / "shifting" / f"Cb_{Path(image.filename).name}", "Cb Blocks Shifted", -128, 127 )
-        show_blocks(Cr_blocks[:10, :10], INTER_IMAGE_DIR / "shifting" / f"Cr_{Path(image.filename).name}", "Cr Blocks Shifted", -128, 127 )
-
-        # Discrete Cosine Transform (DCT)
-        Y_blocks, Cb_blocks, Cr_blocks = DCT_2D(Y_blocks, Cb_blocks, Cr_blocks)
-        show_blocks(Y_blocks[:10, :10], INTER_IMAGE_DIR / "dct" / f"Y_{Path(image.filename).name}", "Y Blocks after DCT")
-        show_blocks(Cb_blocks[:10, :10], INTER_IMAGE_DIR / "dct" / f"Cb_{Path(image.filename).name}", "Cb Blocks after DCT")
-        show_blocks(Cr_blocks[:10, :10], INTER_IMAGE_DIR / "dct" / f"Cr_{Path(image.filename).name}", "Cr Blocks after DCT")
-
-        # Inverse Discrete Cosine Transform (DCT) ONLY FOR VERIFICATION PURPOSES!!!
-        I_Y_blocks, I_Cb_blocks, I_Cr_blocks = IDCT_2D(Y_blocks, Cb_blocks, Cr_blocks)
-        show_blocks(I_Y_blocks[:10, :10], INTER_IMAGE_DIR / "idct" / f"Y_{Path(image.filename).name}",
-                    "Y Blocks after IDCT", -128, 127)
-        show_blocks(I_Cb_blocks[:10, :10], INTER_IMAGE_DIR / "idct" / f"Cb_{Path(image.filename).name}",
-                    "Cb Blocks after IDCT", -128, 127)
-        show_blocks(I_Cr_blocks[:10, :10], INTER_IMAGE_DIR / "idct" / f"Cr_{Path(image.filename).name}",
-                    "Cr Blocks after IDCT", -128, 127)
-
-        # Quantization (quantization table/matrix!)
-        quantizer = Quantizer(50) # use base quality factor of 50
-        Y_blocks, Cb_blocks, Cr_blocks = quantizer.quantize_blocks(Y_blocks, Cb_blocks, Cr_blocks)
-        show_blocks(Y_blocks[:10, :10], INTER_IMAGE_DIR / "quantization" / f"Y_{Path(image.filename).name}",
+        stage.count(blocks=(Y_blocks.size + Cb_blocks.size + Cr_blocks.size) // 64)
+    if config.save_previews:
+        preview(show_blocks, Y_blocks[:10, :10], INTER_IMAGE_DIR / "shifting" / f"Y_{name}", "Y Blocks Shifted", -128, 127)
+        preview(show_blocks, Cb_blocks[:10, :10], INTER_IMAGE_DIR / "shifting" / f"Cb_{name}", "Cb Blocks Shifted", -128, 127 )
+        preview(show_blocks, Cr_blocks[:10, :10], INTER_IMAGE_DIR / "shifting" / f"Cr_{name}", "Cr Blocks Shifted", -128, 127 )
+
+    # Discrete Cosine Transform (DCT)
+    with instruments.measure("DCT_2D", name) as stage:
+        Y_blocks, Cb_blocks, Cr_blocks = DCT_2D(Y_blocks, Cb_blocks, Cr_blocks, config.dct_backend)
+        stage.count(blocks=(Y_blocks.size + Cb_blocks.size + Cr_blocks.size) // 64)
+    if config.save_previews:
+        preview(show_blocks, Y_blocks[:10, :10], INTER_IMAGE_DIR / "dct" / f"Y_{name}", "Y Blocks after DCT")
+        preview(show_blocks, Cb_blocks[:10, :10], INTER_IMAGE_DIR / "dct" / f"Cb_{name}", "Cb Blocks after DCT")
+        preview(show_blocks, Cr_blocks[:10, :10], INTER_IMAGE_DIR / "dct" / f"Cr_{name}", "Cr Blocks after DCT")
+
+    # Inverse Discrete Cosine Transform (DCT) ONLY FOR VERIFICATION PURPOSES!!!
+    if config.verify:
+        dct_blocks = (Y_blocks, Cb_blocks, Cr_blocks)
+        if config.dct_backend == "aan":
+            # AAN coefficients are scaled --> descale them for the float IDCT
+            dct_blocks = [aan_descale(blocks) for blocks in dct_blocks]
+        I_Y_blocks, I_Cb_blocks, I_Cr_blocks = IDCT_2D(*dct_blocks)
+        if config.save_previews:
+            preview(show_blocks, I_Y_blocks[:10, :10], INTER_IMAGE_DIR / "idct" / f"Y_{name}",
+                        "Y Blocks after IDCT", -128, 127)
+            preview(show_blocks, I_Cb_blocks[:10, :10], INTER_IMAGE_DIR / "idct" / f"Cb_{name}",
+                        "Cb Blocks after IDCT", -128, 127)
+            preview(show_blocks, I_Cr_blocks[:10, :10], INTER_IMAGE_DIR / "idct" / f"Cr_{name}",
+                        "Cr Blocks after IDCT", -128, 127)
+
+    # Interleaved scan: pad the block grids to whole MCUs
+    # (4:2:0 --> one MCU = 2 x 2 Y blocks + 1 Cb block + 1 Cr block)
+    h_factor, v_factor = subsampler.luma_sampling_factors()
+    assembler = ScanAssembler(h_factor, v_factor)
+    Y_blocks, Cb_blocks, Cr_blocks = assembler.pad_to_mcus(Y_blocks, Cb_blocks, Cr_blocks, w, h)
+
+    def preview_quantized(Y_blocks, Cb_blocks, Cr_blocks):
+        preview(show_blocks, Y_blocks[:10, :10], INTER_IMAGE_DIR / "quantization" / f"Y_{name}",
                     "Y Blocks after Quantization")
-        show_blocks(Cb_blocks[:10, :10], INTER_IMAGE_DIR / "quantization" / f"Cb_{Path(image.filename).name}",
+        preview(show_blocks, Cb_blocks[:10, :10], INTER_IMAGE_DIR / "quantization" / f"Cb_{name}",
                     "Cb Blocks after Quantization")
-        show_blocks(Cr_blocks[:10, :10], INTER_IMAGE_DIR / "quantization" / f"Cr_{Path(image.filename).name}",
+        preview(show_blocks, Cr_blocks[:10, :10], INTER_IMAGE_DIR / "quantization" / f"Cr_{name}",
                     "Cr Blocks after Quantization")
 
-        # Zigzag scan/ordering
-        scanner = ZigZagScanner()
-        Y_scan, Cb_scan, Cr_scan = scanner.zigzag_all_blocks(Y_blocks, Cb_blocks, Cr_blocks)
-        print(f"AFTER ZIGZAG: Y: {Y_scan}, Cb: {Cb_scan}, Cr: {Cr_scan}")
+    # Quantization + entropy coding + frame (shared with RateController, see FrameEncoder.encode_frame)
+    # Save image to output directory --> add appropriate extension (.jpeg)
+    # --> also reuse original file name (get it via Path), see out_path above
+    num_bytes = encode_frame((Y_blocks, Cb_blocks, Cr_blocks), config.q_factor, assembler, assembler.luma_order(w, h),
+                             w, h, out_path, config, entropy_workers, entropy_pool, instruments, name,
+                             preview_quantized if config.save_previews else None)
+    print(f"Saved JPEG to '{out_path}' ({num_bytes} bytes)")
+    return {"source": image.filename, "output": str(out_path), "width": w, "height": h,
+            "bytes": num_bytes, "stages": instruments.records[first_record:]}
+
+# Encode an image file, but look it up in the EncodeCache first (cache=None --> always encode)
+# --> a hit only hashes the file and copies the cached JPEG, the source image is NOT decoded
+# --> diagnostic runs bypass the cache (the previews need the whole pipeline)
+def encode_cached(path, config=CONFIG, cache=None, **kwargs):
+    if cache is None or config.diagnostics:
+        with Image.open(path) as image:
+            return encode_image(image, config, **kwargs)
+
+    key = cache.file_key(path, config)
+    data = cache.get(key)
+    if data is not None:
+        out_path = (Path(kwargs.get("out_dir", OUT_IMAGE_DIR)) / Path(path).name).with_suffix(".jpg")
+        out_path.write_bytes(data)
+        # Image size from the header only (no decoding)
+        with Image.open(path) as image:
+            w, h = image.size
+        print(f"Saved JPEG to '{out_path}' ({len(data)} bytes, cached)")
+        return {"source": str(path), "output": str(out_path), "width": w, "height": h, "bytes": len(data),
+                "cached": True}
+
+    with Image.open(path) as image:
+        result = encode_image(image, config, **kwargs)
+    cache.put(key, Path(result["output"]).read_bytes())
+    result["cached"] = False
+    return result
+
+# Per-process state of a batch worker, set up once by init_batch_worker
+__worker_sink = None
+__worker_cache = None
+
+# Batch worker setup (initializer of encode_batch's pool) --> shared by all images of the worker:
+# - one DiagnosticsSink (background thread of the worker): previews of one image are rendered while
+#   the next images are encoded, pending previews are saved when the worker exits
+# - one EncodeCache (cache: its (directory, max_bytes) or None) --> its running total carries over
+#   from image to image instead of starting from a pickled snapshot of the parent's cache every time
+def init_batch_worker(config=CONFIG, cache=None):
+    global __worker_sink, __worker_cache
+    if cache is None:
+        __worker_cache = None
+    elif __worker_cache is None or (__worker_cache.directory, __worker_cache.max_bytes) != cache:
+        __worker_cache = EncodeCache(*cache)
+    if config.save_previews and __worker_sink is None:
+        __worker_sink = config.diagnostics_sink("thread")
+        # atexit does not run in forked pool workers, multiprocessing's exit finalizers do
+        atexit.register(__worker_sink.close)
+        multiprocessing.util.Finalize(__worker_sink, __worker_sink.close, exitpriority=10)
 
-        # Differential encoding (DC)
-        diff_encoder = DifferentialEncoder()
-        Y_diff, Cb_diff, Cr_diff = diff_encoder.differential_encode(Y_scan, Cb_scan, Cr_scan)
+# Batch worker: open and encode one image file --> errors are returned instead of raised,
+# so that one broken image does not stop the whole batch
+# cache: (directory, max_bytes) of the EncodeCache or None, see init_batch_worker
+def encode_file(path, config=CONFIG, cache=None):
+    start = time.perf_counter()
+    try:
+        # Workers of a given executor (no initializer) are set up with their first image
+        init_batch_worker(config, cache)
+        with config.instrumentation() as instruments:
+            result = encode_cached(path, config, __worker_cache, entropy_workers=1, sink=__worker_sink,
+                                   instruments=instruments)
+    except Exception as e:
+        result = {"source": str(path), "error": f"{type(e).__name__}: {e}"}
+    result["seconds"] = time.perf_counter() - start
+    return result
 
-        # Run-length Encoding (AC)
-        rl_encoder = RunLengthEncoder()
-        Y_rle, Cb_rle, Cr_rle = rl_encoder.rl_encode(Y_diff, Cb_diff, Cr_diff)
+# Encode many image files with a pool of worker processes (whole pipeline per image inside a worker)
+# paths: any iterable of file paths --> consumed lazily
+# executor: an existing (process) pool to reuse, otherwise a ProcessPoolExecutor with <workers> processes
+# max_in_flight: max. number of submitted but unfinished images --> bounds the memory of queued work
+# config: PipelineConfig used for every image
+# cache: EncodeCache whose directory is shared by all workers (None --> no cache)
+#        --> every worker opens its own EncodeCache on it, their hits/misses are added to cache at the end
+#            and the size limit is enforced once more (workers only see each other's entries when they rescan)
+# --> returns the per-image result dicts (in input order) and prints the aggregate throughput
+# --> if a worker process dies (OOM, segfault), the pool is broken: its pending images and all
+#     remaining paths get an error result (like the errors inside a worker, see encode_file)
+def encode_batch(paths, workers=BATCH_WORKERS, max_in_flight=None, executor=None, config=CONFIG, cache=None):
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    paths = iter(paths)
+    results = {}
+    start = time.perf_counter()
 
-        # Symbol Encoding
-        symbol_encoder = SymbolEncoder()
-        Y_sym, Cb_sym, Cr_sym = symbol_encoder.encode(Y_rle, Cb_rle, Cr_rle)
-        print(f"Y: {Y_sym}, Cb: {Cb_sym}, Cr: {Cr_sym}")
+    # A given executor is left open for the caller
+    cache_spec = (cache.directory, cache.max_bytes) if cache is not None else None
+    pool = executor or ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                                           initargs=(config, cache_spec))
+    with contextlib.nullcontext(pool) if executor else pool:
+        pending = {}
+        index = 0
+        broken = None
+        while True:
+            # Top up the pool, but never keep more than max_in_flight images queued
+            # (broken pool --> all remaining paths at once, each gets the error result)
+            for path in itertools.islice(paths, max_in_flight - len(pending)) if broken is None else paths:
+                if broken is None:
+                    try:
+                        pending[pool.submit(encode_file, path, config, cache_spec)] = (index, path)
+                        index += 1
+                        continue
+                    except BrokenExecutor as e:
+                        broken = f"{type(e).__name__}: {e}"
+                results[index] = {"source": str(path), "error": broken}
+                index += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                position, path = pending.pop(future)
+                try:
+                    results[position] = future.result()
+                except Exception as e:
+                    results[position] = {"source": str(path), "error": f"{type(e).__name__}: {e}"}
+                    if isinstance(e, BrokenExecutor):
+                        broken = results[position]["error"]
 
-        # Huffman Encoding (Huffman tables!)
-        huffman_encoder = HuffmanEncoder()
-        Y_tables = huffman_encoder.build_tables(Y_sym)
-        Cb_tables = huffman_encoder.build_tables(Cb_sym)
-        Cr_tables = huffman_encoder.build_tables(Cr_sym)
+    if cache is not None:
+        cache.hits += sum(1 for result in results.values() if result.get("cached") is True)
+        cache.misses += sum(1 for result in results.values() if result.get("cached") is False)
+        cache.evict()
 
-        Y_bits = huffman_encoder.encode_bitstream(Y_sym, Y_tables)
-        Cb_bits = huffman_encoder.encode_bitstream(Cb_sym, Cb_tables)
-        Cr_bits = huffman_encoder.encode_bitstream(Cr_sym, Cr_tables)
+    elapsed = time.perf_counter() - start
+    results = [results[i] for i in range(len(results))]
+    print_batch_summary(results, elapsed)
+    if cache is not None:
+        print(f"Cache: {cache.hits} hits, {cache.misses} misses, {cache.size} of {cache.max_bytes} bytes used")
+    return results
 
-        print(f"Y_bits: {Y_bits}")
-        print(f"Cb_bits: {Cb_bits}")
-        print(f"Cr_bits: {Cr_bits}")
+def print_batch_summary(results, elapsed):
+    failed = [result for result in results if "error" in result]
+    cached = sum(1 for result in results if result.get("cached"))
+    megapixels = sum(result["width"] * result["height"] for result in results if "error" not in result) / 1e6
+    for result in failed:
+        print(f"FAILED '{result['source']}': {result['error']}")
+    print(f"Encoded {len(results) - len(failed)}/{len(results)} images ({cached} from cache) in {elapsed:.2f} s "
+          f"--> {len(results) / max(elapsed, 1e-9):.2f} images/s, {megapixels / max(elapsed, 1e-9):.2f} MP/s")
+
+if __name__ == '__main__':
+
+    # Use this for debugging/viewing purposes
+    if CONFIG.verbose:
+        np.set_printoptions(threshold=sys.maxsize)
+
+    # Fetch all images (lazily --> handles, NOT opened images)
+    images = get_images(SRC_IMAGE_DIR)
+    cache = EncodeCache(ENCODE_CACHE_DIR, ENCODE_CACHE_BYTES) if ENCODE_CACHE_DIR else None
 
-        # Frame builder --> construct/display JPEG encoded image!
+    if BATCH_WORKERS == 1:
+        # Single process --> one image after the other, each opened only when it is encoded
+        # (previews are saved in the background while the next images are encoded)
+        # One entropy pool for all images (instead of one per image with restart markers)
+        results = []
+        with CONFIG.instrumentation() as instruments, \
+                (CONFIG.diagnostics_sink() if CONFIG.save_previews else contextlib.nullcontext()) as sink, \
+                EXECUTORS[CONFIG.entropy_executor](max_workers=ENTROPY_WORKERS) as entropy_pool:
+            for handle in images:
+                results.append(encode_cached(handle.path, CONFIG, cache, sink=sink, instruments=instruments,
+                                             entropy_pool=entropy_pool))
+    else:
+        # Handles are pulled lazily by encode_batch --> discovery overlaps with encoding
+        results = encode_batch((handle.path for handle in images), cache=cache)
 
-        # Save image to output directory --> add appropriate extension (.jpeg)
-        # --> also reuse original file name (get it via Path)
-        out_path = (OUT_IMAGE_DIR / Path(image.filename).name).with_suffix(".jpg")
-        #save_image(converted, out_path)
+    # Per-stage measurements of all images --> JSON lines + summary table
+    if CONFIG.instrument:
+        records = [record for result in results for record in result.get("stages", [])]
+        write_jsonl(records, STAGE_LOG)
+        print(summary_table(records))
 
     # See PyCharm help at https://www.jetbrains.com/help/pycharm/
\ No newline at end of file